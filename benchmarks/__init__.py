@@ -0,0 +1,11 @@
+"""Performance benchmarks for seacargos.
+
+Benchmarks import application modules the same way the web application
+does, so seacargos directory is added to python path here."""
+
+import os
+import sys
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "seacargos")
+)
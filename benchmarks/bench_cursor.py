@@ -0,0 +1,48 @@
+"""Benchmark cursor materialisation on tracking documents.
+
+Compares the old BSON -> extended JSON -> python path with plain
+iteration used by cursors.to_records(). Both paths decode the same raw
+BSON batch, as pymongo cursor does.
+
+Usage: python -m benchmarks.bench_cursor
+"""
+
+import json
+import sys
+import time
+
+import bson
+from bson.json_util import dumps
+
+from benchmarks.data import tracking_documents
+
+from cursors import to_records
+
+SIZES = (10_000, 100_000)
+
+
+def old_path(raw: bytes) -> list:
+    return json.loads(dumps(bson.decode_iter(raw)))
+
+
+def new_path(raw: bytes) -> list:
+    return to_records(bson.decode_iter(raw))
+
+
+def timeit(func, raw: bytes) -> float:
+    start = time.perf_counter()
+    func(raw)
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    for size in SIZES:
+        raw = b"".join(bson.encode(doc) for doc in tracking_documents(size))
+        old, new = timeit(old_path, raw), timeit(new_path, raw)
+        print(f"{size:>7} documents: json round trip {old:6.2f} s, "
+              f"to_records {new:6.2f} s, speedup x{old / new:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
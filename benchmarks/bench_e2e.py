@@ -0,0 +1,159 @@
+"""End-to-end benchmarks against local mongod and ONE stub.
+
+For every data set size tracking collection of a scratch database is
+loaded with synthetic shipments and benchmarked:
+- records_to_update: regular update query of records with overdue events.
+- regular_schedule_update: the whole regular update pipeline, ONE requests
+  go to local stub which serves progressed schedules. Tracking collection
+  is loaded again before every run.
+- dashboard, dashboard_delay, details: dashboard views of one user served
+  by Flask test client, times are per request. Tracking summary cache is
+  cleared before every request, so every request queries database.
+
+Carrier rate limit is disabled. Scratch database is dropped at the end.
+
+Usage: python -m benchmarks.bench_e2e [--mongo mongodb://localhost:27017]
+       [--db seacargos_benchmark] [--sizes 1k,10k] [--repeat 5]
+"""
+
+import os
+import sys
+import time
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from benchmarks import stub, suite
+from benchmarks.data import carrier_schedule, document, shipments, today
+
+USER = "user0"
+
+
+def request_times(client, url: str, requests: int, before=None) -> dict:
+    """Return statistics of GET request times after one warm up request."""
+    client.get(url)
+    runs = []
+    for _ in range(requests):
+        if before:
+            before()
+        start = time.perf_counter()
+        response = client.get(url)
+        runs.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            sys.exit(f"GET {url} failed with {response.status_code}.")
+    return suite.summary(runs)
+
+
+def main() -> int:
+    parser = suite.parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        "--mongo", default=os.getenv("BENCH_MONGO_URI",
+                                     "mongodb://localhost:27017"),
+        help="MongoDB uri, default BENCH_MONGO_URI or localhost"
+    )
+    parser.add_argument("--db", default="seacargos_benchmark",
+                        help="scratch database name, dropped on exit")
+    parser.add_argument("--users", type=int, default=10,
+                        help="users which own shipments")
+    parser.add_argument("--requests", type=int, default=50,
+                        help="requests per dashboard view")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="ONE stub latency, seconds")
+    options = parser.parse_args()
+    if "bench" not in options.db:
+        sys.exit("Scratch database name must contain 'bench'.")
+    if options.output:
+        options.output = os.path.abspath(options.output)
+
+    conn = MongoClient(options.mongo, serverSelectionTimeoutMS=3000)
+    try:
+        mongod = conn.server_info()["version"]
+    except PyMongoError as err:
+        sys.exit(f"MongoDB is not available at {options.mongo}: {err}")
+    db = conn[options.db]
+
+    # ETL and web application modules read settings on import
+    server = stub.start(options.latency)
+    os.environ.update({
+        "ONE_URL": server.url, "ONE_RATE": "0", "ONE_HOST_CONCURRENCY": "32",
+        "FLASK_DB_FRONTEND_URI": options.mongo, "FLASK_DB_NAME": options.db,
+        "FLASK_SECRET_KEY": "benchmark",
+    })
+    os.chdir(os.path.join(suite.ROOT, "seacargos"))
+    import dashboard
+    from config import create_app
+    from etl.oneline_update import records_to_update, regular_schedule_update
+    from home import user_cache
+    from indexes import ensure_indexes
+
+    app = create_app()
+    client = app.test_client()
+    now = today()
+    results = {}
+    try:
+        for size_name, size in suite.sizes(options.sizes).items():
+            items = shipments(size, options.users, options.seed, now)
+            docs = [document(item, now) for item in items]
+            server.schedules = {item["container"]["copNo"]:
+                                carrier_schedule(item, now) for item in items}
+
+            def load(_=None):
+                conn.drop_database(options.db)
+                for i in range(0, len(docs), 10_000):
+                    db.tracking.insert_many(
+                        [dict(doc) for doc in docs[i:i + 10_000]]
+                    )
+                ensure_indexes(db)
+
+            load()
+            print(f"{size} shipments loaded, "
+                  f"{db.tracking.count_documents({'trackEnd': None})} active")
+
+            name = f"records_to_update/{size_name}"
+            found = len(records_to_update(conn, db) or [])
+            result = suite.measure(lambda _: records_to_update(conn, db),
+                                   options.repeat, collect=True)
+            result["items"] = found
+            results[name] = result
+            suite.report(name, result, found)
+
+            name = f"regular_schedule_update/{size_name}"
+            result = suite.measure(lambda _: regular_schedule_update(conn, db),
+                                   options.repeat, load, collect=True)
+            run = db.etl_runs.find_one({"pipeline": "regular"}) or {}
+            result["items"] = run.get("records", {}).get("processed", 0)
+            result["stages"] = run.get("stages", {})
+            results[name] = result
+            suite.report(name, result, result["items"])
+
+            # Dashboard user and its session
+            load()
+            user_id = db.users.insert_one(
+                {"name": USER, "password": "", "role": "user", "active": True}
+            ).inserted_id
+            user_cache.clear()
+            with client.session_transaction() as session:
+                session["user_id"] = str(user_id)
+            record = db.tracking.find_one({"user": USER, "trackEnd": None})
+            urls = {
+                "dashboard": "/dashboard/",
+                "dashboard_delay": "/dashboard/?sort=delay&order=asc",
+                "details": f"/dashboard/{record['bkgNo']}/",
+            }
+            for case, url in urls.items():
+                name = f"{case}/{size_name}"
+                result = request_times(
+                    client, url, options.requests,
+                    lambda: dashboard.summary_cache.invalidate(USER)
+                )
+                results[name] = result
+                suite.report(name, result)
+    finally:
+        conn.drop_database(options.db)
+        server.shutdown()
+    suite.save("e2e", results, options, options.output, mongod=mongod)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
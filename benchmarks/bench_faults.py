@@ -0,0 +1,45 @@
+"""Check schedule fetching against local ONE stub with injected faults.
+
+Stub answers fail_rate share of requests with fail_status code. Client
+retries are disabled, so failed records are recovered by retry rounds of
+extract_schedule_details() and circuit breaker probing.
+
+Usage: python -m benchmarks.bench_faults [records] [fail_rate] [fail_status]
+"""
+
+import os
+import sys
+import time
+
+from benchmarks import stub
+
+
+def main() -> int:
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fail_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    fail_status = int(sys.argv[3]) if len(sys.argv) > 3 else 503
+    server = stub.start(0.01, fail_rate, fail_status)
+    # ETL modules read settings on import
+    os.environ["ONE_URL"] = server.url
+    os.environ["ONE_RETRIES"] = "0"
+    os.environ.setdefault("ONE_RATE", "200")
+    os.environ.setdefault("ONE_RETRY_ROUNDS", "5")
+    os.environ.setdefault("ONE_RETRY_DELAY", "0.2")
+    os.environ.setdefault("ONE_BREAKER_RESET", "0.5")
+    from etl.oneline_update import extract_schedule_details
+
+    recs = [{"bkgNo": f"SHAB{i:08d}", "copNo": f"CSHA{i:08d}"}
+            for i in range(records)]
+    start = time.perf_counter()
+    extract_schedule_details(recs)
+    elapsed = time.perf_counter() - start
+    fetched = sum(1 for r in recs if r["schedule"])
+    print(f"{records} records, {fail_rate:.0%} {fail_status} responses: "
+          f"{fetched} fetched with {server.requests} requests "
+          f"in {elapsed:.2f} s")
+    server.shutdown()
+    return 0 if fetched == records else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
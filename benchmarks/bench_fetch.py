@@ -0,0 +1,42 @@
+"""Benchmark concurrent schedule fetching against local ONE stub.
+
+Carrier rate limit is disabled, so results show fetch concurrency only.
+
+Usage: python -m benchmarks.bench_fetch [records] [latency]
+"""
+
+import os
+import sys
+import time
+
+from benchmarks import stub
+
+WORKERS = (1, 8, 32)
+
+
+def main() -> int:
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    server = stub.start(latency)
+    # ETL module reads settings on import
+    os.environ["ONE_URL"] = server.url
+    os.environ["ONE_HOST_CONCURRENCY"] = str(max(WORKERS))
+    os.environ["ONE_RATE"] = "0"
+    from etl.oneline_update import extract_schedule_details
+
+    print(f"{records} records, stub latency {latency * 1000:.0f} ms")
+    for workers in WORKERS:
+        recs = [{"bkgNo": f"SHAB{i:08d}", "copNo": f"CSHA{i:08d}"}
+                for i in range(records)]
+        start = time.perf_counter()
+        extract_schedule_details(recs, workers=workers)
+        elapsed = time.perf_counter() - start
+        fetched = sum(1 for r in recs if r["schedule"])
+        print(f"workers={workers:>3}: {elapsed:7.2f} s, "
+              f"{fetched / elapsed:8.1f} records/s ({fetched} fetched)")
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
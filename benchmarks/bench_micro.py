@@ -0,0 +1,80 @@
+"""Micro-benchmarks of ETL transforms and dashboard render helpers.
+
+Every case runs over synthetic shipments of each data set size:
+- transform: regular update transform of raw schedules chunk by chunk.
+- transform_data: registration transform of raw payloads one by one.
+- table_fields: dashboard table rows of tracking documents.
+- schedule_table_data: dashboard table data from tracking documents.
+- prepare_record_details: shipment details of tracking documents.
+
+Usage: python -m benchmarks.bench_micro [--sizes 1k,10k] [--repeat 5]
+"""
+
+import sys
+
+from benchmarks import suite
+from benchmarks.data import document, shipments, today, update_records
+
+from dashboard import prepare_record_details, schedule_table_data
+from etl.oneline import transform_data
+from etl.oneline_update import CHUNK_SIZE, transform
+from etl.table import table_fields
+
+
+def chunked_transform(records: list) -> None:
+    for i in range(0, len(records), CHUNK_SIZE):
+        transform(records[i:i + CHUNK_SIZE])
+
+
+def registration_transform(payloads: list) -> None:
+    for data in payloads:
+        transform_data(data)
+
+
+def main() -> int:
+    options = suite.parser(__doc__.splitlines()[0]).parse_args()
+    now = today()
+    results = {}
+    for size_name, size in suite.sizes(options.sizes).items():
+        items = shipments(size, seed=options.seed, now=now)
+        docs = [document(item, now) for item in items]
+        records = update_records(items)
+        print(f"{size} shipments, "
+              f"{sum(len(r['schedule']) for r in records)} events")
+
+        # Transforms update their input, every run gets fresh copies
+        cases = {
+            "transform": (
+                chunked_transform,
+                lambda: [dict(rec) for rec in records]
+            ),
+            "transform_data": (
+                registration_transform,
+                lambda: [{"container_data": dict(item["container"]),
+                          "schedule_data": item["schedule"],
+                          "query": dict(item["query"])} for item in items]
+            ),
+            "table_fields": (
+                lambda docs: [table_fields(doc) for doc in docs],
+                lambda: docs
+            ),
+            "schedule_table_data": (
+                schedule_table_data, lambda: docs
+            ),
+            "prepare_record_details": (
+                lambda docs: [prepare_record_details(doc) for doc in docs],
+                lambda: docs
+            ),
+        }
+        for case, (func, setup) in cases.items():
+            name = f"{case}/{size_name}"
+            result = suite.measure(func, options.repeat, setup)
+            result["items"] = size
+            results[name] = result
+            suite.report(name, result, size)
+    suite.save("micro", results, options, options.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
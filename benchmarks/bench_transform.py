@@ -0,0 +1,102 @@
+"""Benchmark batched schedule transform against per-event transform.
+
+Usage: python -m benchmarks.bench_transform [events]
+"""
+
+import copy
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.data import START
+from benchmarks.stub import SCHEDULE
+
+
+def raw_records(events: int, seed: int = 0) -> list:
+    """Return records with raw ONE schedules of about events in total."""
+    rnd = random.Random(seed)
+    records = []
+    for i in range(events // len(SCHEDULE)):
+        departure = START + timedelta(days=rnd.randint(0, 60),
+                                      hours=rnd.randint(0, 23))
+        schedule = []
+        for no, (event, status) in enumerate(SCHEDULE, 1):
+            date = departure + timedelta(days=3 * (no - 1))
+            schedule.append({
+                "no": str(no), "statusNm": event, "placeNm": "SHANGHAI",
+                "yardNm": "YANGSHAN TERMINAL",
+                "eventDt": date.strftime("%Y-%m-%d %H:%M"), "actTpCd": status,
+                "vslEngNm": "ONE HARMONY", "lloydNo": "9321483"
+            })
+        records.append({"bkgNo": f"SHAB{i:08d}", "schedule": schedule})
+    return records
+
+
+def str_to_date(string: str) -> datetime:
+    """Per-event date parser used before batched transform."""
+    if len(string) == 16:
+        return datetime.strptime(string, "%Y-%m-%d %H:%M")
+    return datetime.fromtimestamp(0)
+
+
+def legacy_transform(records: list) -> list:
+    """Per-event transform used before batched transform."""
+    schedule_keys = ["no", "statusNm", "placeNm", "yardNm",
+                     "eventDt", "actTpCd", "actTpCd", "vslEngNm",
+                     "lloydNo"]
+    for rec in records:
+        if not rec["schedule"]:
+            continue
+        if not set(schedule_keys).issubset(set(rec["schedule"][0])):
+            rec["schedule"] = None
+            continue
+        transformed_schedule = []
+        for i in rec["schedule"]:
+            transformed_schedule.append(
+                {"no": int(i["no"]),
+                 "event": i["statusNm"],
+                 "placeName": i["placeNm"],
+                 "yardName": i["yardNm"],
+                 "eventDate": str_to_date(i["eventDt"]),
+                 "status": i["actTpCd"],
+                 "vesselName": i["vslEngNm"],
+                 "imo": i["lloydNo"]}
+            )
+            if i["statusNm"].find("Departure from Port of Loading") > -1:
+                rec["departureDate"] = str_to_date(i["eventDt"])
+                rec["outboundTerminal"] = f"{i['placeNm']} | {i['yardNm']}"
+            if i["statusNm"].find("Arrival at Port of Discharging") > -1:
+                rec["arrivalDate"] = str_to_date(i["eventDt"])
+                rec["inboundTerminal"] = f"{i['placeNm']} | {i['yardNm']}"
+            rec["schedule"] = transformed_schedule
+    return records
+
+
+def timed(function, records: list, chunk_size: int) -> float:
+    """Return seconds to transform records chunk by chunk."""
+    start = time.perf_counter()
+    for i in range(0, len(records), chunk_size):
+        function(records[i:i + chunk_size])
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    from etl.oneline_update import CHUNK_SIZE, transform
+
+    records = raw_records(events)
+    legacy = copy.deepcopy(records)
+    legacy_time = timed(legacy_transform, legacy, CHUNK_SIZE)
+    batched_time = timed(transform, records, CHUNK_SIZE)
+    assert records == legacy, "Batched transform result differs"
+    total = sum(len(rec["schedule"]) for rec in records)
+    print(f"{total} events in chunks of {CHUNK_SIZE} records")
+    print(f"per-event transform: {legacy_time:6.3f} s")
+    print(f"batched transform:   {batched_time:6.3f} s "
+          f"(x{legacy_time / batched_time:.1f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""Compare saved benchmark results of two commits.
+
+Prints median times of benchmarks found in both files and their change,
+exits with status 1 if any benchmark is slower than threshold.
+
+Usage: python -m benchmarks.compare BASE.json NEW.json [--threshold 0.1]
+"""
+
+import argparse
+import sys
+
+from benchmarks.suite import load
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base", help="results of base commit")
+    parser.add_argument("new", help="results of new commit")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as regression")
+    options = parser.parse_args()
+    base, new = load(options.base), load(options.new)
+    print(f"base {base['environment']['commit']}, "
+          f"new {new['environment']['commit']}")
+    regressions = []
+    for name, result in new["results"].items():
+        if name not in base["results"]:
+            continue
+        old = base["results"][name]["median"]
+        change = result["median"] / old - 1 if old else 0.0
+        mark = ""
+        if change > options.threshold:
+            mark = " slower"
+            regressions.append(name)
+        elif change < -options.threshold:
+            mark = " faster"
+        print(f"{name:<40} {old * 1000:10.2f} ms -> "
+              f"{result['median'] * 1000:10.2f} ms {change:+7.1%}{mark}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""Synthetic ONE tracking data for benchmarks.
+
+Shipments are generated by seeded random generator, so the same seed
+gives the same data on every run. Every shipment has ONE-like raw
+payloads (f_cmd=121 container item and f_cmd=125 schedule items) and
+tracking documents are built from them with registration transform, so
+they have all fields ETL pipelines store (table row, schedule hashes, next
+check). Event dates are set relative to `now`: past events are actual,
+some of them are still estimated (overdue records which regular update
+selects) and shipments which completed schedule are arrived (trackEnd).
+
+Usage: python -m benchmarks.data [shipments]
+"""
+
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+START = datetime(2023, 1, 1)
+
+# Named data set sizes, shipments
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+PORTS = [
+    ("SHANGHAI", "YANGSHAN TERMINAL"), ("BUSAN", "BUSAN NEW PORT"),
+    ("SINGAPORE", "PASIR PANJANG TERMINAL"), ("TOKYO", "OHI TERMINAL"),
+    ("ROTTERDAM", "EUROMAX TERMINAL"), ("HAMBURG", "BURCHARDKAI TERMINAL"),
+    ("LOS ANGELES", "YUSEN TERMINAL"), ("NEW YORK", "MAHER TERMINAL"),
+    ("JEBEL ALI", "DP WORLD TERMINAL 3"), ("SANTOS", "BTP TERMINAL"),
+]
+VESSELS = [
+    ("ONE HARMONY", "9321483"), ("ONE COMMITMENT", "9741372"),
+    ("ONE STORK", "9776171"), ("ONE APUS", "9806079"),
+    ("MOL TRIUMPH", "9769271"), ("YM WELLNESS", "9704609"),
+]
+CONTAINER_TYPES = ["40'DRY HC", "20'DRY", "40'DRY", "40'REEFER HC"]
+
+# Share of events of the last OVERDUE_DAYS which are still estimated,
+# share of missing event dates and shipments without reference id and
+# requested ETA
+OVERDUE = 0.5
+OVERDUE_DAYS = 3
+MISSING_DATE = 0.03
+NO_REFERENCE = 0.2
+
+
+def today() -> datetime:
+    """Return start of current day, default reference time of data."""
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _events(rnd: random.Random) -> Tuple[List[tuple], int]:
+    """Return shipment events and transit days.
+
+    Events are (name, place, yard, vessel, imo, days from departure).
+    """
+    origin, destination = rnd.sample(PORTS, 2)
+    vessel, imo = rnd.choice(VESSELS)
+    voyage = f"'{vessel} {rnd.randint(1, 99):03d}E'"
+    days = rnd.randint(14, 45)
+    events = [
+        ("Empty Container Release to Shipper", origin, "", "",
+         -rnd.randint(3, 7)),
+        ("Gate In to Outbound Terminal", origin, "", "", -rnd.randint(1, 2)),
+        (f"Loaded on {voyage} at Port of Loading", origin, vessel, imo, -0.5),
+        (f"{voyage} Departure from Port of Loading", origin, vessel, imo, 0),
+    ]
+    if rnd.random() < 0.3:
+        # Transhipment via hub port
+        hub = rnd.choice([p for p in PORTS if p not in (origin, destination)])
+        middle = days // 2
+        events += [
+            (f"{voyage} Arrival at Transhipment Port", hub, vessel, imo,
+             middle),
+            (f"Unloaded from {voyage} at Transhipment Port", hub, vessel,
+             imo, middle + 0.5),
+        ]
+        vessel, imo = rnd.choice(VESSELS)
+        voyage = f"'{vessel} {rnd.randint(1, 99):03d}W'"
+        events += [
+            (f"Loaded on {voyage} at Transhipment Port", hub, vessel, imo,
+             middle + 3),
+            (f"{voyage} Departure from Transhipment Port", hub, vessel, imo,
+             middle + 3.5),
+        ]
+    events += [
+        (f"{voyage} Arrival at Port of Discharging", destination, vessel,
+         imo, days),
+        (f"Unloaded from {voyage} at Port of Discharging", destination,
+         vessel, imo, days + 0.5),
+        ("Gate Out from Inbound Terminal for Delivery", destination, "", "",
+         days + rnd.randint(1, 5)),
+    ]
+    return [(name, place, yard, vessel, imo, day)
+            for name, (place, yard), vessel, imo, day in events], days
+
+
+def raw_schedule(events: List[tuple], departure: datetime, now: datetime,
+                 rnd: random.Random, delay: int = 0) -> List[dict]:
+    """Return ONE-like f_cmd=125 response items for shipment events.
+
+    Events after departure are shifted by delay days. Events before now
+    are actual, some recent ones are left estimated (overdue). Events after
+    now are estimated.
+    """
+    schedule = []
+    for no, (name, place, yard, vessel, imo, day) in enumerate(events, 1):
+        date = departure + timedelta(days=day + delay * (day > 0))
+        if date <= now - timedelta(days=OVERDUE_DAYS):
+            status = "A"
+        elif date <= now and rnd.random() >= OVERDUE:
+            status = "A"
+        else:
+            status = "E"
+        date_string = date.strftime("%Y-%m-%d %H:%M")
+        if status == "E" and rnd.random() < MISSING_DATE:
+            date_string = ""
+        schedule.append({
+            "no": str(no), "statusNm": name, "placeNm": place,
+            "yardNm": yard, "eventDt": date_string, "actTpCd": status,
+            "vslEngNm": vessel, "lloydNo": imo, "hashColumns": [],
+        })
+    return schedule
+
+
+def shipment(i: int, user: str = "user", rnd: random.Random = random,
+             now: Optional[datetime] = None) -> dict:
+    """Return raw ONE payloads and registration query of a shipment.
+
+    Returns dict with query (dashboard registration input), container
+    (f_cmd=121 item), planned and current schedules (f_cmd=125 items).
+    """
+    now = now or today()
+    events, days = _events(rnd)
+    departure = now + timedelta(days=rnd.randint(-60, 20),
+                                hours=rnd.randint(0, 23))
+    delay = rnd.choice([0, 0, 0, 1, 2, 5])
+    planned = raw_schedule(events, departure, departure, rnd)
+    current = raw_schedule(events, departure, now, rnd, delay)
+    arrival = departure + timedelta(days=days + delay)
+    reference = rnd.random() >= NO_REFERENCE
+    return {
+        "query": {
+            "bkgNo": f"SHAB{i:08d}", "user": user, "line": "ONE",
+            "refId": f"PO-{i}" if reference else "-",
+            "requestedETA": (
+                (arrival + timedelta(days=rnd.randint(-3, 7)))
+                .strftime("%Y-%m-%d") if reference else "-"
+            ),
+        },
+        "container": {
+            "cntrNo": f"ONEU{i:07d}",
+            "cntrTpszNm": rnd.choice(CONTAINER_TYPES),
+            "copNo": f"CSHA{i:08d}", "bkgNo": f"SHAB{i:08d}",
+            "blNo": f"ONEYSHAB{i:08d}",
+        },
+        "planned": planned, "schedule": current,
+    }
+
+
+def shipments(n: int, users: int = 10, seed: int = 0,
+              now: Optional[datetime] = None) -> List[dict]:
+    """Return n shipments spread over users user0, user1, ..."""
+    rnd = random.Random(seed)
+    now = now or today()
+    return [shipment(i, f"user{i % users}", rnd, now) for i in range(n)]
+
+
+def document(item: dict, now: Optional[datetime] = None) -> dict:
+    """Return tracking collection document for shipment.
+
+    Document is built by registration transform from planned schedule,
+    current schedule is applied as regular updates did. Shipments with
+    all events actual are arrived.
+    """
+    from etl.oneline import transform_data
+    from etl.schedule import next_check, schedule_hashes, transform_schedules
+    from etl.table import table_fields
+
+    now = now or today()
+    doc = transform_data({
+        "container_data": dict(item["container"]),
+        "schedule_data": [dict(e) for e in item["planned"]],
+        "query": dict(item["query"]),
+    })
+    doc.update(transform_schedules([item["schedule"]])[0])
+    schedule = doc["schedule"]
+    doc["scheduleHashes"] = schedule_hashes(schedule)
+    doc["nextCheck"] = next_check(schedule, now)
+    doc.update(table_fields(doc))
+    doc["trackStart"] = min(doc["initSchedule"][0]["eventDate"] or now, now)
+    doc["regularUpdate"] = doc["recordUpdate"] = now
+    if all(event["status"] == "A" for event in schedule):
+        doc["trackEnd"] = schedule[-1]["eventDate"]
+    return doc
+
+
+def tracking_document(i: int, user: str = "user",
+                      rnd: random.Random = random,
+                      now: Optional[datetime] = None) -> dict:
+    """Return tracking collection document like ETL pipelines load."""
+    now = now or START
+    return document(shipment(i, user, rnd, now), now)
+
+
+def tracking_documents(n: int, users: int = 10, seed: int = 0,
+                       now: Optional[datetime] = None) -> List[dict]:
+    """Return n tracking documents spread over several users."""
+    now = now or START
+    return [document(item, now) for item in shipments(n, users, seed, now)]
+
+
+def update_records(items: List[dict]) -> List[dict]:
+    """Return raw records like regular update extracts for shipments."""
+    return [{"bkgNo": item["container"]["bkgNo"],
+             "copNo": item["container"]["copNo"],
+             "schedule": item["schedule"]} for item in items]
+
+
+def carrier_schedule(item: dict, now: datetime) -> List[dict]:
+    """Return f_cmd=125 items carrier serves for shipment at now.
+
+    Estimated events before now are reported as actual.
+    """
+    schedule = []
+    for event in item["schedule"]:
+        event = dict(event)
+        if event["eventDt"] and event["eventDt"] <= f"{now:%Y-%m-%d %H:%M}":
+            event["actTpCd"] = "A"
+        schedule.append(event)
+    return schedule
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    now = today()
+    docs = [document(item, now) for item in shipments(n, now=now)]
+    arrived = sum(1 for doc in docs if doc["trackEnd"])
+    overdue = sum(
+        1 for doc in docs if not doc["trackEnd"] and any(
+            e["status"] == "E" and e["eventDate"] and e["eventDate"] <= now
+            for e in doc["schedule"]
+        )
+    )
+    events = sum(len(doc["schedule"]) for doc in docs)
+    print(f"{n} shipments, {events} events, {arrived} arrived, "
+          f"{overdue} active with overdue estimated events")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Local stub of ONE (Ocean Network Express) tracking endpoint.
+
+Serves f_cmd=121 (container data) and f_cmd=125 (schedule data) requests
+with ONE-like payloads and configurable response latency. Responses carry
+ETag header and conditional requests with matching If-None-Match get
+304 Not Modified. Faults are injected with fail_rate share of responses
+with fail_status code (e.g. 429 or 503), server.fail_first first
+responses always fail. Schedules of particular
+shipments are served from server.schedules mapping of copNo to f_cmd=125
+items, other shipments get the same default schedule."""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SCHEDULE = [
+    ("Empty Container Release to Shipper", "E"),
+    ("Gate In to Outbound Terminal", "A"),
+    ("Loaded on 'ONE HARMONY 012E' at Port of Loading", "A"),
+    ("'ONE HARMONY 012E' Departure from Port of Loading", "A"),
+    ("'ONE HARMONY 012E' Arrival at Port of Discharging", "E"),
+    ("Unloaded from 'ONE HARMONY 012E' at Port of Discharging", "E"),
+    ("Gate Out from Inbound Terminal for Delivery", "E"),
+]
+
+
+def container_data(number: str) -> dict:
+    """Return ONE-like f_cmd=121 response item."""
+    return {"cntrNo": "ONEU" + number[-7:].rjust(7, "0"),
+            "cntrTpszNm": "40'DRY HC", "copNo": "C" + number[-11:],
+            "bkgNo": number, "blNo": "ONEY" + number,
+            "hashColumns": []}
+
+
+def schedule_data() -> list:
+    """Return ONE-like f_cmd=125 response items."""
+    return [{"no": str(no), "statusNm": status, "placeNm": "SHANGHAI",
+             "yardNm": "YANGSHAN TERMINAL", "eventDt": "2023-01-15 10:00",
+             "actTpCd": act, "vslEngNm": "ONE HARMONY",
+             "lloydNo": "9321483", "hashColumns": []}
+            for no, (status, act) in enumerate(SCHEDULE, 1)]
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler with server level latency setting."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(
+            urlparse(self.path).query, keep_blank_values=True).items()}
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.requests <= self.server.fail_first
+        if fail or random.random() < self.server.fail_rate:
+            self.send_response(self.server.fail_status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if query.get("f_cmd") == "121":
+            data = {"list": [container_data(query.get("search_name", ""))]}
+        elif query.get("f_cmd") == "125":
+            schedule = self.server.schedules.get(query.get("cop_no"))
+            data = {"list": schedule or schedule_data()}
+        else:
+            data = {}
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(latency: float = 0.05, fail_rate: float = 0.0,
+          fail_status: int = HTTPStatus.SERVICE_UNAVAILABLE
+          ) -> ThreadingHTTPServer:
+    """Start stub server in a daemon thread and return it.
+
+    Server url is available as server.url attribute."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.requests = 0
+    server.lock = threading.Lock()
+    server.fail_rate = fail_rate
+    server.fail_status = fail_status
+    server.fail_first = 0
+    server.schedules = {}
+    server.url = f"http://127.0.0.1:{server.server_port}/ecom/stub.do"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,143 @@
+"""Benchmark suite helpers: timing, command line and JSON results.
+
+Benchmarks measure every case several times and save results with the
+environment they ran in (git commit, python, platform) to
+benchmarks/results/<benchmark>-<commit>.json, so results of two commits
+can be compared with python -m benchmarks.compare."""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.data import SIZES
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(func: Callable[[Any], Any], repeat: int = 5,
+            setup: Optional[Callable[[], Any]] = None,
+            collect: bool = False) -> dict:
+    """Run func repeat times and return timing statistics in seconds.
+
+    Optional setup prepares func argument before every run and is not
+    timed. Garbage collection is disabled during runs as in timeit,
+    collect=True keeps it enabled for end-to-end runs.
+    """
+    runs = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        if not collect:
+            gc.disable()
+        try:
+            start = time.perf_counter()
+            func(arg)
+            runs.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return summary(runs)
+
+
+def summary(runs: List[float]) -> dict:
+    """Return statistics of measured times."""
+    ordered = sorted(runs)
+    return {
+        "runs": [round(run, 6) for run in runs],
+        "min": round(ordered[0], 6),
+        "median": round(statistics.median(ordered), 6),
+        "p95": round(ordered[min(len(ordered) - 1,
+                                 int(0.95 * len(ordered)))], 6),
+    }
+
+
+def _git(*args: str) -> Optional[str]:
+    """Return git command output or None if git is not available."""
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True,
+            check=True, timeout=30
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return
+
+
+def environment() -> dict:
+    """Return description of benchmark environment."""
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "date": datetime.now().replace(microsecond=0).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def parser(description: str) -> argparse.ArgumentParser:
+    """Return argument parser with common benchmark options."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--sizes", default=",".join(SIZES),
+        help=f"comma separated data set sizes: {', '.join(SIZES)}"
+    )
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of every benchmark")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="synthetic data seed")
+    parser.add_argument("--output", help="results file, default "
+                        "benchmarks/results/<benchmark>-<commit>.json")
+    return parser
+
+
+def sizes(option: str) -> Dict[str, int]:
+    """Parse --sizes option to named data set sizes."""
+    names = [name.strip() for name in option.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SIZES]
+    if unknown:
+        sys.exit(f"Unknown sizes {unknown}, use {list(SIZES)}.")
+    return {name: SIZES[name] for name in names}
+
+
+def report(name: str, result: dict, items: Optional[int] = None) -> None:
+    """Print benchmark result line."""
+    line = (f"{name:<40} median {result['median'] * 1000:10.2f} ms, "
+            f"min {result['min'] * 1000:10.2f} ms")
+    if items:
+        line += f", {items / result['median']:12.0f} items/s"
+    print(line, flush=True)
+
+
+def save(benchmark: str, results: dict, options: argparse.Namespace,
+         path: Optional[str] = None, **extra: Any) -> str:
+    """Save benchmark results with environment to JSON file.
+
+    Returns path of the file.
+    """
+    env = environment()
+    env.update(extra)
+    if not path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR,
+                            f"{benchmark}-{env['commit'] or 'local'}.json")
+    data = {"benchmark": benchmark, "environment": env,
+            "options": vars(options), "results": results}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+    print(f"Results saved to {path}")
+    return path
+
+
+def load(path: str) -> dict:
+    """Load saved benchmark results."""
+    with open(path) as f:
+        return json.load(f)
@@ -1,30 +1,31 @@
 import functools
-import json
-import os
+import logging
+import threading
+from datetime import datetime, timedelta
 
-from bson.json_util import dumps
-from bson.objectid import ObjectId
-from flask import Blueprint, g, redirect, render_template, session, url_for
+from flask import Blueprint, current_app, g, redirect, render_template, url_for
 from pymongo.database import Database
 from werkzeug.exceptions import abort
 from werkzeug.security import generate_password_hash
 
-from db import db_conn
+from cursors import to_records
+from db import db_conn, pool_stats
+from etl.metrics import recent_runs
 from forms import AddUserForm, BlockUserForm, EditUserForm, UnblockUserForm
+from home import invalidate_user
+from logindex import LogIndex
 
 bp = Blueprint('admin', __name__)
+logger = logging.getLogger("WEB APP")
 ROLES = [("admin", "admin"), ("user", "user")]
 
+# Seconds before database stats snapshot is refreshed, one refresh at a time
+STATS_INTERVAL = 300
+_snapshot_lock = threading.Lock()
 
-@bp.before_app_request
-def load_logged_in_user():
-    """Loads logged in user from session to g."""
-    user_id = session.get("user_id")
-    if user_id is None:
-        g.user = None
-    else:
-        db = db_conn()[g.db_name]
-        g.user = db.users.find_one({"_id": ObjectId(user_id)})
+# ETL log index and loggers always shown on admin panel
+etl_log_index = LogIndex("logs/one.log")
+LOGGERS = ["ONE ETL", "ONE ETL UPDATE", "WEB APP", "DATABASE"]
 
 
 def admin_login_required(view):
@@ -45,8 +46,16 @@ def admin():
     db = db_conn()[g.db_name]
     content = {}
     content["users"] = users_stats(db)
-    content["db"] = database_stats(db)
+    snapshot = database_snapshot(
+        db, current_app.config.get("STATS_INTERVAL", STATS_INTERVAL)
+    )
+    content["db"] = snapshot["stats"]
+    content["db_collected"] = snapshot["collected"].strftime(
+        "%d-%m-%Y %H:%M"
+    )
+    content["pool"] = pool_stats()
     content["etl_log"] = etl_log_stats()
+    content["runs"] = run_summaries(db)
     return render_template("admin/admin.html", content=content)
 
 
@@ -104,6 +113,7 @@ def edit_user():
         # Check request and change data, and make update or send error message
         if len(change) > 0:
             cur = db.users.update_one(query, {"$set": change})
+            invalidate_user(form.username.data)
             if cur.raw_result["updatedExisting"]:
                 content["info"] = "User data successfully updated."
             else:
@@ -130,6 +140,7 @@ def block_user():
             {"name": form.username.data},
             {"$set": {"active": False}}
         )
+        invalidate_user(form.username.data)
         if cur.raw_result["updatedExisting"]:
             content["info"] = "User successfully blocked."
         else:
@@ -154,6 +165,7 @@ def unblock_user():
             {"name": form.username.data},
             {"$set": {"active": True}}
         )
+        invalidate_user(form.username.data)
         if cur.raw_result["updatedExisting"]:
             content["info"] = "User successfully unblocked."
         else:
@@ -187,13 +199,20 @@ def size(bytes: int) -> str:
 
 
 def users_stats(db: Database) -> dict:
-    """Prepare and return user stats."""
-    stats = {}
-    stats["admin"] = db.users.count_documents({"role": "admin"})
-    stats["user"] = db.users.count_documents({"role": "user"})
-    stats["active"] = db.users.count_documents({"active": True})
-    stats["blocked"] = db.users.count_documents({"active": False})
-    return stats
+    """Prepare and return user stats with one aggregation."""
+    def count(field: str, value) -> dict:
+        return {"$sum": {"$cond": [{"$eq": [f"${field}", value]}, 1, 0]}}
+
+    cursor = db.users.aggregate([
+        {"$group": {"_id": None,
+                    "admin": count("role", "admin"),
+                    "user": count("role", "user"),
+                    "active": count("active", True),
+                    "blocked": count("active", False)}}
+    ])
+    result = next(cursor, {})
+    return {key: result.get(key, 0)
+            for key in ("admin", "user", "active", "blocked")}
 
 
 def database_stats(db: Database) -> dict:
@@ -212,19 +231,75 @@ def database_stats(db: Database) -> dict:
     return stats
 
 
+def refresh_database_snapshot(db: Database) -> dict:
+    """Collect database stats and save them to snapshots collection."""
+    snapshot = {"_id": "database", "stats": database_stats(db),
+                "collected": datetime.now().replace(microsecond=0)}
+    db.snapshots.replace_one({"_id": "database"}, snapshot, upsert=True)
+    return snapshot
+
+
+def _refresh_in_background(db: Database) -> None:
+    """Refresh database stats snapshot and release refresh lock."""
+    try:
+        refresh_database_snapshot(db)
+    except BaseException as err:
+        logger.error(f"Database stats snapshot refresh failed: {err}")
+    finally:
+        _snapshot_lock.release()
+
+
+def database_snapshot(db: Database, interval: int = STATS_INTERVAL) -> dict:
+    """Return database stats snapshot with collection time.
+
+    Missing snapshot is collected at once. Snapshot older than interval
+    seconds is returned as is and refreshed in a background thread, so
+    dbstats and collstats commands never slow down admin page.
+    """
+    snapshot = db.snapshots.find_one({"_id": "database"})
+    if snapshot is None:
+        return refresh_database_snapshot(db)
+    stale = snapshot["collected"] + timedelta(seconds=interval)
+    if stale < datetime.now() and _snapshot_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, args=(db,),
+                         daemon=True).start()
+    return snapshot
+
+
 def etl_log_stats() -> dict:
-    """Prepare and return etl log stats."""
-    stats = {}
-    if os.path.exists("logs/one.log"):
-        with open("logs/one.log", "r") as f:
-            logs = len(f.readlines())
-        stats["size"] = size(os.path.getsize("logs/one.log"))
-    else:
-        stats["size"] = logs = 0
-    stats["logs"] = logs
+    """Prepare and return etl log stats.
+
+    Log file and its backups are indexed incrementally, only new lines are
+    read on every call.
+    """
+    index = etl_log_index.refresh()
+    stats = {"logs": index["lines"], "files": index["files"],
+             "size": size(index["size"]), "loggers": {}}
+    for name in LOGGERS:
+        stats["loggers"][name] = {"WARNING": 0, "ERROR": 0}
+    stats["loggers"].update(index["loggers"])
     return stats
 
 
+def run_summaries(db: Database, limit: int = 10) -> list:
+    """Prepare summaries of recent ETL pipeline runs."""
+    summaries = []
+    for run in recent_runs(db, limit):
+        p95 = run["carrier"]["p95"]
+        summaries.append({
+            "started": run["started"].strftime("%d-%m-%Y %H:%M"),
+            "pipeline": run["pipeline"], "user": run["user"] or "",
+            "status": run["status"], "duration": f"{run['duration']:.1f} s",
+            "records": ", ".join(f"{k} {v}"
+                                 for k, v in run["records"].items()),
+            "stages": ", ".join(f"{k} {v:.1f} s"
+                                for k, v in run["stages"].items()),
+            "carrier": (f"{run['carrier']['requests']} requests, "
+                        f"p95 {p95:.2f} s" if p95 is not None else ""),
+        })
+    return summaries
+
+
 def active_user_names_from_db(db: Database) -> list:
     """Returns list of active user names from database."""
     cursor = db.users.find({"active": True}, {"_id": 0, "name": 1})
@@ -240,4 +315,4 @@ def blocked_user_names_from_db(db: Database) -> list:
 def users_from_db(db: Database) -> dict:
     """Returns users info from database."""
     cursor = db.users.find({}, {"_id": 0, "password": 0})
-    return json.loads(dumps(cursor))
+    return to_records(cursor)
@@ -0,0 +1,59 @@
+"""In-process caches for web application."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """Thread safe LRU cache with time to live for every item.
+
+    Items expire ttl seconds after they were set, least recently used items
+    are evicted when cache grows over maxsize.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return cached value or None if key is missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Cache value for key."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove key from cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_if(self, predicate: Callable[[Any], bool]) -> None:
+        """Remove all items with values matching predicate."""
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items()
+                    if predicate(value)]
+            for key in keys:
+                del self._data[key]
+
+    def clear(self) -> None:
+        """Remove all items from cache."""
+        with self._lock:
+            self._data.clear()
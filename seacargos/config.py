@@ -8,6 +8,7 @@ import admin
 import dashboard
 import db
 import home
+import monitoring
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +27,9 @@ def create_app(test_config=None):
     app.config.from_prefixed_env()
     env = os.environ.get("FLASK_ENV", "Not set")
 
+    # Register database profiler before database clients are created
+    monitoring.init_app(app)
+
     # Register db functions and configure db
     db.init_app(app)
     if env == "development" or env == "production":
@@ -41,4 +45,6 @@ def create_app(test_config=None):
     app.register_blueprint(dashboard.bp)
     app.add_url_rule("/dashboard/", endpoint="dashboard")
 
+    app.register_blueprint(monitoring.bp)
+
     return app
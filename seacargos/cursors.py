@@ -0,0 +1,13 @@
+"""Helpers to materialise MongoDB cursors as python objects."""
+
+from typing import Iterable, List, Mapping
+
+
+def to_records(cursor: Iterable[Mapping]) -> List[dict]:
+    """Return cursor documents as a list of dicts.
+
+    Documents are decoded from BSON by pymongo only once and keep native
+    python types (datetime, ObjectId). Use query projection to limit
+    returned fields.
+    """
+    return [dict(doc) for doc in cursor]
@@ -1,41 +1,54 @@
+import base64
+import csv
 import functools
+import io
 import logging
 from datetime import datetime as dt
-from typing import Optional
+from datetime import timedelta
+from typing import Any, Iterable, List, Optional, Tuple
 
-from bson.objectid import ObjectId
+from bson import ObjectId
+from bson.errors import BSONError
+from bson.json_util import dumps, loads
 from flask import (
     Blueprint,
+    current_app,
     flash,
     g,
+    jsonify,
     redirect,
     render_template,
+    request,
     session,
     url_for,
 )
-from pymongo.command_cursor import CommandCursor
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.database import Database
 from pymongo.errors import ConnectionFailure
 from werkzeug.exceptions import abort
 
+from cache import TTLCache
 from db import db_conn
-from etl.oneline import etl_one
-from etl.oneline_update import record_schedule_update, user_schedule_update
-from forms import TrackingForm
+from etl.oneline import etl_one, insert_pending, retry_pending
+from forms import ImportForm, TrackingForm
+from jobs import data_version, enqueue, finished_jobs, job_status
 
 bp = Blueprint("dashboard", __name__)
 logger = logging.getLogger("WEB APP")
 
+# Tracking summary cache, invalidated when user records are written by
+# web application or jobs change user data version
+SUMMARY_TTL = 30
+summary_cache = TTLCache(ttl=SUMMARY_TTL)
 
-@bp.before_app_request
-def load_logged_in_user():
-    """Loads logged in user from session to g."""
-    user_id = session.get("user_id")
-    if user_id is None:
-        g.user = None
-    else:
-        db = db_conn()[g.db_name]
-        g.user = db.users.find_one({"_id": ObjectId(user_id)})
+# Shipments table sort keys and page size limits
+SORT_KEYS = {"departure": "departureDate", "arrival": "arrivalDate",
+             "delay": "etaDelay", "refId": "refId"}
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Maximum number of shipments in one import
+MAX_IMPORT_ITEMS = 1000
 
 
 def user_login_required(view):
@@ -78,14 +91,20 @@ def dashboard():
             if form.requested_eta.raw_data:
                 query["requestedETA"] = form.requested_eta.raw_data[0]
 
-            # Run ETL and update content
-            content.update(etl_one(query, conn, db))
+            # Run ETL in background or inline and update content
+            if current_app.config.get("ASYNC_REGISTRATION", True):
+                content.update(register_pending(query, conn, db))
+            else:
+                content.update(etl_one(query, conn, db))
+            summary_cache.invalidate(g.user["name"])
 
     # GET request
+    for message in registration_messages(db, g.user["name"]) or []:
+        flash(message)
     content.update(tracking_summary(db, g.user["name"]))
-    cursor = db_tracking_data(g.user["name"], db)
-    table_data = schedule_table_data(cursor)
-    content.update(table_data)
+    params = page_params(request.args)
+    content.update(db_tracking_data(g.user["name"], db, **params))
+    content["page"] = params
 
     return render_template("dashboard/dashboard.html", content=content)
 
@@ -97,7 +116,9 @@ def details(bkg_number):
     db = db_conn()[g.db_name]
     content = {}
     record = db_get_record(db, bkg_number, g.user["name"])
-    if record:
+    if record and record.get("pending"):
+        flash(f"Record {bkg_number} is being added to database.")
+    elif record:
         content["details"] = prepare_record_details(record)
         content["bkg_number"] = bkg_number
         content["record_update"] = dt.strftime(record["recordUpdate"],
@@ -111,11 +132,11 @@ def details(bkg_number):
 @bp.route("/dashboard/update/")
 @user_login_required
 def update():
-    """Update user shipments schedules for all records."""
-    conn = db_conn()
-    db = conn[g.db_name]
-    user = g.user["name"]
-    user_schedule_update(conn, db, user)
+    """Queue update of user shipments schedules for all records."""
+    db = db_conn()[g.db_name]
+    job_id = enqueue(db, "user_update", g.user["name"])
+    summary_cache.invalidate(g.user["name"])
+    flash(f"Schedule update is queued (job {job_id}).")
 
     return redirect(url_for("dashboard"))
 
@@ -123,15 +144,102 @@ def update():
 @bp.route("/dashboard/update/<bkg_number>/")
 @user_login_required
 def update_record(bkg_number):
-    """Update user shipment schedule for one record."""
-    conn = db_conn()
-    db = conn[g.db_name]
-    user = g.user["name"]
-    record_schedule_update(conn, db, user, bkg_number)
+    """Queue update of user shipment schedule for one record."""
+    db = db_conn()[g.db_name]
+    job_id = enqueue(db, "record_update", g.user["name"],
+                     {"bkg_number": bkg_number})
+    summary_cache.invalidate(g.user["name"])
+    flash(f"Schedule update is queued (job {job_id}).")
 
     return redirect(url_for("dashboard.details", bkg_number=bkg_number))
 
 
+@bp.route("/dashboard/retry/<record_id>/")
+@user_login_required
+def retry_registration(record_id):
+    """Queue registration of failed pending record again."""
+    db = db_conn()[g.db_name]
+    if (not ObjectId.is_valid(record_id)
+            or not retry_pending(ObjectId(record_id), g.user["name"], db)):
+        abort(404, "Record not found.")
+    job_id = enqueue(db, "register", g.user["name"],
+                     {"record_id": record_id})
+    flash(f"Shipment registration is queued (job {job_id}).")
+
+    return redirect(url_for("dashboard"))
+
+
+@bp.route("/dashboard/jobs/<job_id>/")
+@user_login_required
+def job(job_id):
+    """Return user job status and progress."""
+    db = db_conn()[g.db_name]
+    status = job_status(db, job_id, g.user["name"])
+    if not status:
+        abort(404, "Job not found.")
+    return jsonify(status)
+
+
+@bp.route("/dashboard/import/", methods=("GET", "POST"))
+@user_login_required
+def bulk_import():
+    """Import new shipments from text or CSV file."""
+    db = db_conn()[g.db_name]
+    form = ImportForm()
+    content = {"form": form}
+
+    # POST request
+    if form.validate_on_submit():
+        text = form.items.data or ""
+        if form.file.data:
+            text += "\n" + form.file.data.read().decode("utf-8", "replace")
+        user = g.user["name"]
+        queries, skipped = parse_import_items(text, user)
+        if len(queries) > MAX_IMPORT_ITEMS:
+            flash(f"Import is limited to {MAX_IMPORT_ITEMS} items.")
+            return render_template("dashboard/import.html", content=content)
+        # Prevent records duplication in database
+        existing = existing_items(db, user, queries) or set()
+        items = []
+        for query in queries:
+            number = query.get("bkgNo") or query.get("cntrNo")
+            if number in existing:
+                skipped.append({"item": number, "status": "already exists"})
+            else:
+                items.append(query)
+        if not items:
+            content["outcomes"] = skipped
+            return render_template("dashboard/import.html", content=content)
+        job_id = enqueue(db, "import", user,
+                         {"items": items, "skipped": skipped})
+        summary_cache.invalidate(user)
+        return redirect(url_for("dashboard.import_status", job_id=job_id))
+
+    return render_template("dashboard/import.html", content=content)
+
+
+@bp.route("/dashboard/import/<job_id>/")
+@user_login_required
+def import_status(job_id):
+    """Display import job status and outcome for every item."""
+    db = db_conn()[g.db_name]
+    status = job_status(db, job_id, g.user["name"])
+    if not status:
+        abort(404, "Job not found.")
+    content = {"job": status, "outcomes": status.get("outcomes")}
+    return render_template("dashboard/import.html", content=content)
+
+
+def register_pending(query: dict, conn: MongoClient, db: Database) -> dict:
+    """Insert pending tracking record and queue job to complete it."""
+    record_id = insert_pending(query, conn, db)
+    if not record_id:
+        return {"etl_message": "Database write operation failure"}
+    job_id = enqueue(db, "register", query["user"],
+                     {"record_id": str(record_id)})
+    return {"etl_message": f"New record is being added (job {job_id})"}
+
+
 def ping(func):
     """Catch database CRUD ops exceptions."""
     @functools.wraps(func)
@@ -147,22 +255,100 @@ def ping(func):
     return wrapper
 
 
-def validate_booking_number(user_input: str) -> Optional[dict]:
-    """Validate user booking or container number input.
-    Return MongoDB query."""
+@ping
+def registration_messages(db: Database, user: str) -> List[str]:
+    """Return messages of registration jobs finished since last dashboard
+    view of the session (or during the last day)."""
+    seen = session.get("registrations_seen")
+    since = dt.fromisoformat(seen) if seen else dt.now() - timedelta(days=1)
+    seen_ids = session.get("registrations_seen_ids", [])
+    jobs = finished_jobs(db, user, "register", since,
+                         [ObjectId(i) for i in seen_ids])
+    if jobs:
+        last = jobs[-1]["finished"]
+        # Remember jobs of the last finish time, more jobs can finish then
+        ids = [str(job["_id"]) for job in jobs if job["finished"] == last]
+        if last == since:
+            ids += seen_ids
+        session["registrations_seen"] = last.isoformat()
+        session["registrations_seen_ids"] = ids
+    return [job.get("message") or job.get("error") for job in jobs]
+
+
+def booking_query(user_input: str, user: str) -> Optional[dict]:
+    """Return MongoDB query for booking or container number or None if
+    number is incorrect."""
     if len(user_input) == 12 and user_input[0:4].isalpha():
         return {
             "bkgNo": user_input.upper(), "line": "ONE",
-            "user": g.user["name"], "trackEnd": None
+            "user": user, "trackEnd": None
         }
     elif len(user_input) == 11:
         return {
             "cntrNo": user_input.upper(), "line": "ONE",
-            "user": g.user["name"], "trackEnd": None
+            "user": user, "trackEnd": None
         }
-    else:
+
+
+def validate_booking_number(user_input: str) -> Optional[dict]:
+    """Validate user booking or container number input.
+    Return MongoDB query."""
+    query = booking_query(user_input, g.user["name"])
+    if not query:
         flash(f"Incorrect booking or container number {user_input}")
-        return
+    return query
+
+
+def parse_import_items(text: str, user: str) -> Tuple[List[dict], List[dict]]:
+    """Parse imported lines: number[,refId[,requestedETA]].
+
+    Returns queries for correct items and outcomes for incorrect and
+    repeated items.
+    """
+    queries, skipped, seen = [], [], set()
+    for row in csv.reader(io.StringIO(text)):
+        row = [cell.strip() for cell in row]
+        if not row or not row[0]:
+            continue
+        number = row[0].upper()
+        query = booking_query(number, user)
+        if not query:
+            skipped.append({"item": number, "status": "incorrect number"})
+            continue
+        if number in seen:
+            skipped.append({"item": number, "status": "duplicate"})
+            continue
+        query["refId"] = row[1] if len(row) > 1 and row[1] else "-"
+        query["requestedETA"] = "-"
+        if len(row) > 2 and row[2]:
+            try:
+                dt.strptime(row[2], "%Y-%m-%d")
+            except ValueError:
+                skipped.append({"item": number,
+                                "status": "incorrect requested ETA"})
+                continue
+            query["requestedETA"] = row[2]
+        seen.add(number)
+        queries.append(query)
+    return queries, skipped
+
+
+@ping
+def existing_items(db: Database, user: str, queries: List[dict]) -> set:
+    """Return booking and container numbers of queries which already exist
+    in tracking collection, with one database query."""
+    bookings = [q["bkgNo"] for q in queries if "bkgNo" in q]
+    containers = [q["cntrNo"] for q in queries if "cntrNo" in q]
+    cursor = db.tracking.find(
+        {"user": user, "trackEnd": None,
+         "$or": [{"bkgNo": {"$in": bookings}},
+                 {"cntrNo": {"$in": containers}}]},
+        {"_id": 0, "bkgNo": 1, "cntrNo": 1}
+    )
+    existing = set()
+    for c in cursor:
+        existing.update((c.get("bkgNo"), c.get("cntrNo")))
+    return existing
 
 
 @ping
@@ -188,78 +374,140 @@ def check_db_records(query: dict, db: Database) -> Optional[bool]:
 
 @ping
 def tracking_summary(db: Database, user: str) -> dict:
-    """Get tracking summary from database."""
-    active = db.tracking.count_documents(
-        {"user": user, "trackEnd": None}
-    )
-    arrived = db.tracking.count_documents(
-        {"user": user, "trackEnd": {"$ne": None}}
-    )
-    total = db.tracking.count_documents({"user": user})
-    last_update = db.tracking.aggregate(
-        [{"$match": {"user": user, "trackEnd": None}},
-         {"$sort": {"regularUpdate": -1}},
-         {"$limit": 1},
-         {"$project": {"regularUpdate": 1, "_id": 0}}]
+    """Get tracking summary from database.
+
+    Summary is calculated with one aggregation and cached for user during
+    SUMMARY_TTL seconds or until a job changes user data version.
+    """
+    version = data_version(db, user)
+    cached = summary_cache.get(user)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    active = {"$eq": [{"$ifNull": ["$trackEnd", None]}, None]}
+    cursor = db.tracking.aggregate(
+        [{"$match": {"user": user}},
+         {"$group": {
+             "_id": None,
+             "total": {"$sum": 1},
+             "active": {"$sum": {"$cond": [active, 1, 0]}},
+             "lastUpdate": {
+                 "$max": {"$cond": [active, "$regularUpdate", None]}
+             }}}]
     )
+    record = next(cursor, None) or {"total": 0, "active": 0}
 
-    if last_update._has_next():
+    if record.get("lastUpdate"):
         format_string = "%d-%m-%Y %H:%M"
-        record = last_update.next()
-        date = record["regularUpdate"].strftime(format_string)
+        date = record["lastUpdate"].strftime(format_string)
     else:
         date = "-"
 
-    summary = {"active": active, "arrived": arrived,
-               "total": total, "updated_on": date}
+    summary = {"active": record["active"],
+               "arrived": record["total"] - record["active"],
+               "total": record["total"], "updated_on": date}
+    summary_cache.set(user, (version, summary))
     return summary
 
 
-@ping
-def db_tracking_data(user: str, db: Database) -> CommandCursor:
-    """Get shipments that did not reach destination from
-    tracking collection."""
-    cursor = db.tracking.aggregate(
-        [{"$match": {"user": user, "trackEnd": None}},
-         {"$sort": {"departureDate": -1}},
-         {"$project": {"_id": 0, "schedule": 0, "initSchedule": 0}}]
-    )
-    return cursor
+def encode_page_token(value: Any, record_id: ObjectId) -> str:
+    """Encode last table row sort value and record id."""
+    data = dumps([value, record_id]).encode()
+    return base64.urlsafe_b64encode(data).decode()
 
 
-def schedule_table_data(cursor: CommandCursor) -> dict:
-    """Prepare schedule data for schedule table."""
-    format_string = "%d-%m-%Y %H:%M"
-    table_data = {"table": []}
-    for c in cursor:
-        # Check requestedETA and convert to string
-        eta_delay = "-"
-        if isinstance(c["requestedETA"], dt):
-            eta_delay = (c["arrivalDate"] - c["requestedETA"]).days
-            c["requestedETA"] = c["requestedETA"].strftime("%d-%m-%Y")
-
-        # Construct and append table data row
-        table_data["table"].append(
-            {"refId": c["refId"],
-             "booking": c["bkgNo"], "container": c["cntrNo"],
-             "type": c["cntrType"],
-             "from": {
-                 "location": c["outboundTerminal"].split("|")[0],
-                 "terminal": c["outboundTerminal"].split("|")[-1]
-            },
-                # "departure": dt.strftime(c["departureDate"], format_string),
-                "departure": c["departureDate"].strftime(format_string),
-                "to": {
-                 "location": c["inboundTerminal"].split("|")[0],
-                 "terminal": c["inboundTerminal"].split("|")[-1]
-            },
-                # "arrival": dt.strftime(c["arrivalDate"], format_string),
-                "arrival": c["arrivalDate"].strftime(format_string),
-                "totalDays": (c["arrivalDate"] - c["departureDate"]).days,
-                "requestedETA": c["requestedETA"],
-                "etaDelay": eta_delay
-            }
-        )
+def decode_page_token(token: Optional[str]) -> Optional[list]:
+    """Decode page token, returns None for missing or invalid token.
+
+    Token is client input: sort value must be None, date, integer or
+    string and record id must be ObjectId, so the token can not add query
+    operators to keyset query.
+    """
+    if not token:
+        return
+    try:
+        value, record_id = loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError, BSONError):
+        logger.warning(f"Invalid page token {token}.")
+        return
+    if (isinstance(value, bool)
+            or not isinstance(value, (type(None), dt, int, str))
+            or not isinstance(record_id, ObjectId)):
+        logger.warning(f"Invalid page token {token}.")
+        return
+    return [value, record_id]
+
+
+def page_params(args: dict) -> dict:
+    """Validate dashboard table sort and page parameters."""
+    sort = args.get("sort")
+    if sort not in SORT_KEYS:
+        sort = "departure"
+    order = args.get("order")
+    if order not in ("asc", "desc"):
+        order = "desc"
+    try:
+        size = min(max(int(args.get("size", PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        size = PAGE_SIZE
+    return {"sort": sort, "order": order, "size": size,
+            "after": args.get("after")}
+
+
+def keyset_query(key: str, value: Any, record_id: ObjectId,
+                 order: str) -> dict:
+    """Prepare query for table rows after (value, record_id) position.
+
+    Rows are sorted by key and record id, which is unique even for
+    pending records without booking number. Null values are sorted before
+    any other value in ascending order, as MongoDB does.
+    """
+    if order == "asc":
+        if value is None:
+            return {"$or": [{key: None, "_id": {"$gt": record_id}},
+                            {key: {"$ne": None}}]}
+        return {"$or": [{key: {"$gt": value}},
+                        {key: value, "_id": {"$gt": record_id}}]}
+    if value is None:
+        return {key: None, "_id": {"$lt": record_id}}
+    return {"$or": [{key: {"$lt": value}}, {key: None},
+                    {key: value, "_id": {"$lt": record_id}}]}
+
+
+@ping
+def db_tracking_data(user: str, db: Database, sort: str = "departure",
+                     order: str = "desc", size: int = PAGE_SIZE,
+                     after: Optional[str] = None) -> dict:
+    """Get one page of shipments that did not reach destination from
+    tracking collection.
+
+    Uses keyset pagination: page starts after the row encoded in after
+    token. Returns table rows and token for the next page.
+    """
+    key = SORT_KEYS[sort]
+    direction = ASCENDING if order == "asc" else DESCENDING
+    query = {"user": user, "trackEnd": None}
+    position = decode_page_token(after)
+    if position:
+        query.update(keyset_query(key, *position, order))
+    cursor = db.tracking.find(
+        query, {"tableRow": 1, key: 1}
+    ).sort([(key, direction), ("_id", direction)]).limit(size + 1)
+    records = list(cursor)
+    page = {"table": schedule_table_data(records[:size])["table"],
+            "next": None}
+    if len(records) > size:
+        last = records[size - 1]
+        page["next"] = encode_page_token(last.get(key), last["_id"])
+    return page
+
+
+def schedule_table_data(cursor: Iterable[dict]) -> dict:
+    """Prepare schedule data for schedule table.
+
+    Table rows are prepared by ETL pipelines and stored in tracking
+    records."""
+    table_data = {"table": [c["tableRow"] for c in cursor]}
     return table_data
 
 
@@ -277,26 +525,19 @@ def prepare_record_details(record: Optional[dict]) -> Optional[dict]:
         return
     format_string = "%d-%m-%Y %H:%M"
     details = []
-    for i in zip(record["schedule"], record["initSchedule"]):
-        row = {}
-        row["event"] = i[0]["event"]
-        row["placeName"] = i[0]["placeName"]
-        row["yardName"] = i[0]["yardName"]
-        # Transform if exists
-        if i[1]["eventDate"]:
-            row["plannedDate"] = dt.strftime(i[1]["eventDate"], format_string)
-        else:
-            row["plannedDate"] = ""
-        # Transform if exists
-        if i[0]["eventDate"]:
-            row["actualDate"] = dt.strftime(i[0]["eventDate"], format_string)
-        else:
-            row["actualDate"] = ""
-        # Calculate if exists
-        if i[0]["eventDate"] and i[1]["eventDate"]:
-            row["delta"] = (i[0]["eventDate"] - i[1]["eventDate"]).days
-        else:
-            row["delta"] = ""
-        row["status"] = i[0]["status"]
-        details.append(row)
+    # Missing event dates are None
+    for actual, planned in zip(record["schedule"], record["initSchedule"]):
+        actual_date = actual["eventDate"]
+        planned_date = planned["eventDate"]
+        details.append({
+            "event": actual["event"], "placeName": actual["placeName"],
+            "yardName": actual["yardName"],
+            "plannedDate": (planned_date.strftime(format_string)
+                            if planned_date else ""),
+            "actualDate": (actual_date.strftime(format_string)
+                           if actual_date else ""),
+            "delta": ((actual_date - planned_date).days
+                      if actual_date and planned_date else ""),
+            "status": actual["status"],
+        })
     return details
@@ -1,18 +1,127 @@
-import json
 import logging
-from typing import Optional
+import os
+import threading
+from typing import Dict, Optional
 
-from bson.json_util import dumps
 from flask import Flask, current_app, g
-from pymongo import ASCENDING, MongoClient
+from pymongo import MongoClient, monitoring
 from pymongo.errors import ConnectionFailure
 from werkzeug.security import generate_password_hash
 
+from indexes import check_query_plans, ensure_indexes
+
 logger = logging.getLogger("DATABASE")
 
 
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Collect connection pool statistics for process MongoDB clients."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset all counters."""
+        with self._lock:
+            self.stats = {"pools": 0, "open": 0, "in_use": 0, "created": 0,
+                          "closed": 0, "checkouts": 0, "checkout_failed": 0}
+
+    def snapshot(self) -> dict:
+        """Return copy of current counters."""
+        with self._lock:
+            return dict(self.stats)
+
+    def _inc(self, **changes: int) -> None:
+        with self._lock:
+            for key, value in changes.items():
+                self.stats[key] += value
+
+    def pool_created(self, event):
+        self._inc(pools=1)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        self._inc(pools=-1)
+
+    def connection_created(self, event):
+        self._inc(open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._inc(open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._inc(checkout_failed=1)
+
+    def connection_checked_out(self, event):
+        self._inc(in_use=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._inc(in_use=-1)
+
+
+_pool_stats = PoolStats()
+_clients: Dict[str, MongoClient] = {}
+_clients_pid = os.getpid()
+_clients_lock = threading.Lock()
+
+
+def _reset_clients() -> None:
+    """Forget clients inherited from parent process after fork."""
+    global _clients_pid, _clients_lock
+    _clients.clear()
+    _clients_pid = os.getpid()
+    _clients_lock = threading.Lock()
+    _pool_stats.reset()
+
+
+os.register_at_fork(after_in_child=_reset_clients)
+
+
+def get_client(uri: str, max_pool_size: int = 100,
+               min_pool_size: int = 0) -> MongoClient:
+    """Return process wide MongoDB client for uri.
+
+    Client is created once per process (gunicorn worker) on first call and
+    reused by all requests. Clients created before fork are never used in
+    child processes.
+    """
+    if _clients_pid != os.getpid():
+        _reset_clients()
+    client = _clients.get(uri)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(uri)
+            if client is None:
+                client = MongoClient(
+                    uri, maxPoolSize=max_pool_size,
+                    minPoolSize=min_pool_size, connect=False,
+                    event_listeners=[_pool_stats]
+                )
+                _clients[uri] = client
+    return client
+
+
+def pool_stats() -> dict:
+    """Return connection pool statistics for current process."""
+    stats = _pool_stats.snapshot()
+    stats["clients"] = len(_clients)
+    stats["pid"] = os.getpid()
+    return stats
+
+
 def db_conn() -> Optional[MongoClient]:
-    """Open MongoDB connection.
+    """Get process wide MongoDB client.
 
     Update Flask g object:
     - g.conn = MongoClient.
@@ -20,7 +129,11 @@ def db_conn() -> Optional[MongoClient]:
     """
     if 'conn' not in g:
         try:
-            g.conn = MongoClient(current_app.config['DB_FRONTEND_URI'])
+            g.conn = get_client(
+                current_app.config['DB_FRONTEND_URI'],
+                current_app.config.get("DB_MAX_POOL_SIZE", 100),
+                current_app.config.get("DB_MIN_POOL_SIZE", 0)
+            )
             g.db_name = current_app.config["DB_NAME"]
         except ConnectionFailure:
             logger.error("Database connection failure.")
@@ -32,12 +145,12 @@ def db_conn() -> Optional[MongoClient]:
 
 
 def close_db_conn(exception: BaseException) -> None:
-    """Pop MongoDB connection object from Flask g object and close."""
-    conn = g.pop('conn', None)
+    """Pop MongoDB client from Flask g object.
 
-    if conn is not None:
-        g.pop('db', None)
-        conn.close()
+    Client is shared by the process and stays open for next requests.
+    """
+    g.pop('conn', None)
+    g.pop('db', None)
 
 
 def init_app(app: Flask) -> None:
@@ -48,11 +161,14 @@ def init_app(app: Flask) -> None:
 def setup_db(app: Flask) -> None:
     """Setup database.
 
-    Add 2 first users to database with credentials setup in .env file.
+    Add 2 first users to database with credentials setup in .env file and
+    create collection indexes.
     """
     # Connect to database
     try:
-        conn = MongoClient(app.config['DB_FRONTEND_URI'])
+        conn = get_client(app.config['DB_FRONTEND_URI'],
+                          app.config.get("DB_MAX_POOL_SIZE", 100),
+                          app.config.get("DB_MIN_POOL_SIZE", 0))
         db = conn[app.config["DB_NAME"]]
     except ConnectionFailure:
         logger.error("Database connection failure")
@@ -81,14 +197,6 @@ def setup_db(app: Flask) -> None:
              'active': True}
         )
 
-    # Add username unique index to database users collection
-    cur = db.users.list_indexes()
-    idxs = json.loads(dumps(cur))
-    if len(idxs) == 1:
-        db.users.create_index(
-            [("name", ASCENDING)],
-            unique=True,
-            name="name_index"
-        )
-
-    conn.close()
+    # Create and reconcile collection indexes, check known query plans
+    ensure_indexes(db)
+    check_query_plans(db)
@@ -0,0 +1,282 @@
+"""HTTP client for container shipping carrier web sites.
+
+This module defines CarrierClient class with pooled keep-alive connections,
+request timeouts and retries with exponential backoff on connection
+errors, 429 and 5xx responses. Every attempt is throttled by TokenBucket
+rate limiter and requests are rejected by CircuitBreaker with
+CircuitOpenError while carrier keeps failing. ETL pipelines share one
+client per process, use get_client() to access it. Responses
+can be cached with etl.response_cache.ResponseCache."""
+
+import logging
+import os
+import threading
+import time
+from http import HTTPStatus
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from etl.metrics import observe_request
+from etl.response_cache import ResponseCache
+
+logger = logging.getLogger("ONE ETL")
+
+URL = os.getenv("ONE_URL")
+POOL_SIZE = int(os.getenv("ONE_POOL_SIZE", 32))
+TIMEOUT = float(os.getenv("ONE_TIMEOUT", 30))
+RETRIES = int(os.getenv("ONE_RETRIES", 3))
+BACKOFF = float(os.getenv("ONE_BACKOFF", 0.5))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Requests per second (0 disables rate limiting) and burst size per process.
+# Host concurrency limit of 8 requests at ONE latency of 0.2-0.5 s makes
+# 16-40 requests per second, so default limit only cuts bursts of fast
+# conditional requests and retries.
+RATE = float(os.getenv("ONE_RATE", 50))
+BURST = int(os.getenv("ONE_BURST", 20))
+# Consecutive failures to open circuit and seconds before probe request
+BREAKER_FAILURES = int(os.getenv("ONE_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("ONE_BREAKER_RESET", 30))
+
+
+class CircuitOpenError(requests.RequestException):
+    """Request is rejected because circuit breaker is open."""
+
+
+class TokenBucket:
+    """Thread safe token bucket rate limiter.
+
+    Bucket holds up to burst tokens and is refilled with rate tokens per
+    second, every request takes one token.
+    """
+
+    def __init__(self, rate: float = RATE, burst: int = BURST) -> None:
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait until token is available and take it."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Thread safe circuit breaker.
+
+    Circuit opens after failure_threshold consecutive failures and rejects
+    requests for reset_timeout seconds. Then one probe request is allowed
+    (half open state): success closes circuit, failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Check if request can be made."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def remaining(self) -> float:
+        """Return seconds until probe request is allowed."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0,
+                       self.opened + self.reset_timeout - time.monotonic())
+
+    def success(self) -> None:
+        """Register successful request."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Carrier circuit breaker closed.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def failure(self) -> None:
+        """Register failed request."""
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    logger.warning(
+                        (f"Carrier circuit breaker opened after "
+                         f"{self.failures} failures.")
+                    )
+                self.state = self.OPEN
+                self.opened = time.monotonic()
+
+
+class CarrierClient:
+    """Carrier web site client with connection pool.
+
+    Keeps up to pool_size keep-alive connections per host and retries
+    requests on connection errors, 429 and 5xx responses. Every attempt is
+    limited to rate per second with burst, requests are rejected while
+    circuit breaker is open.
+    """
+
+    def __init__(self, url: Optional[str] = URL,
+                 pool_size: int = POOL_SIZE, timeout: float = TIMEOUT,
+                 retries: int = RETRIES, backoff: float = BACKOFF,
+                 rate: float = RATE, burst: int = BURST,
+                 breaker_failures: int = BREAKER_FAILURES,
+                 breaker_reset: float = BREAKER_RESET) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        # Retries are made by get(), so every attempt takes limiter token
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=0, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def delay(self, attempt: int,
+              r: Optional[requests.Response] = None) -> float:
+        """Return seconds to wait before retry attempt.
+
+        Delay grows exponentially with backoff factor, Retry-After header
+        of 429 and 503 responses in seconds is respected.
+        """
+        retry_after = (r.headers.get("Retry-After", "")
+                       if r is not None else "")
+        if retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** (attempt - 1)
+
+    def get(self, params: dict,
+            headers: Optional[dict] = None) -> requests.Response:
+        """Make GET request to carrier url with query params.
+
+        Connection errors, 429 and 5xx responses are retried up to retries
+        times. Raises CircuitOpenError if circuit breaker is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker is open for {self.url}.")
+        r = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.delay(attempt, r))
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                r = self.session.get(self.url, params=params,
+                                     headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    self.breaker.failure()
+                    raise
+                r = None
+                continue
+            except requests.RequestException:
+                self.breaker.failure()
+                raise
+            finally:
+                observe_request(time.perf_counter() - start)
+            if r.status_code not in RETRY_STATUSES:
+                break
+            if attempt < self.retries:
+                r.close()
+        if r.status_code in RETRY_STATUSES:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return r
+
+    def fetch_json(self, params: dict, cache: Optional[ResponseCache] = None,
+                   key: Optional[str] = None) -> Tuple[int, Optional[dict]]:
+        """Make GET request and return response status code and json data.
+
+        If cache and key are passed, fresh cached response is returned
+        without request, stale one is revalidated with conditional request.
+        """
+        entry = cache.get(key) if cache and key else None
+        if entry and cache.is_fresh(entry):
+            return HTTPStatus.OK, entry["data"]
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        r = self.get(params, headers)
+        if r.status_code == HTTPStatus.NOT_MODIFIED and entry:
+            cache.touch(key)
+            return HTTPStatus.OK, entry["data"]
+        if r.status_code != HTTPStatus.OK:
+            return r.status_code, None
+        data = r.json()
+        if cache and key:
+            cache.store(key, data, r.headers.get("ETag"),
+                        r.headers.get("Last-Modified"))
+        return r.status_code, data
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client() -> CarrierClient:
+    """Return process wide carrier client.
+
+    Client is created on first call in every process, so connections are
+    never shared between forked web server workers.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                if not URL:
+                    logger.error(
+                        "ONE_URL envoronment variable is not available."
+                    )
+                _client = CarrierClient()
+                _client_pid = pid
+    return _client
@@ -0,0 +1,233 @@
+"""ETL pipeline run metrics.
+
+Pipelines measure stage durations, record outcomes and carrier request
+latencies with Run. Finished run is saved to etl_runs collection and its
+counters and histogram buckets are added to a single etl_metrics document,
+so runs of all worker processes are exposed by web application /metrics
+endpoint in Prometheus text format (render())."""
+
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional
+
+from pymongo.database import Database
+
+logger = logging.getLogger("ONE ETL")
+
+# Histogram buckets, seconds
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Run of the calling thread (context) which receives carrier request
+# latencies, worker threads append to the same run
+_current_run = ContextVar("etl_run", default=None)
+_lock = threading.Lock()
+
+
+def observe_request(seconds: float) -> None:
+    """Add carrier request latency to the run of the calling thread."""
+    run = _current_run.get()
+    if run is None:
+        return
+    with _lock:
+        run.latencies.append(seconds)
+
+
+def bind_run(func: Callable) -> Callable:
+    """Bind func to the run of the calling thread.
+
+    Thread pool workers do not inherit context of the thread which submits
+    tasks, so functions they call are bound to its run.
+    """
+    run = _current_run.get()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_run.set(run)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_run.reset(token)
+    return wrapper
+
+
+def percentile(values: List[float], share: float) -> Optional[float]:
+    """Return nearest rank percentile of values or None if empty."""
+    if not values:
+        return
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def buckets(values: List[float], bounds: tuple) -> List[int]:
+    """Count values per histogram bucket, last bucket is +Inf."""
+    counts = [0] * (len(bounds) + 1)
+    for value in values:
+        counts[bisect_left(bounds, value)] += 1
+    return counts
+
+
+class Run:
+    """Metrics of a single ETL pipeline run.
+
+    Run is used as context manager: it receives latencies of carrier
+    requests made by its thread and functions wrapped with bind_run() and
+    is saved to database on exit. Run is
+    marked failed if pipeline raises, runs without records which did not
+    fail are not saved.
+    """
+
+    def __init__(self, pipeline: str, db: Database,
+                 user: Optional[str] = None) -> None:
+        self.pipeline = pipeline
+        self.db = db
+        self.user = user
+        self.started = datetime.now().replace(microsecond=0)
+        self.status = "done"
+        self.stages = Counter()
+        self.records = Counter()
+        self.latencies = []
+        self._start = time.perf_counter()
+
+    def __enter__(self) -> "Run":
+        self._token = _current_run.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        _current_run.reset(self._token)
+        if exc_type is not None:
+            self.status = "failed"
+        if self.records or self.status != "done":
+            self.save()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure duration of pipeline stage, repeated stages add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def count(self, outcome: str, number: int = 1) -> None:
+        """Count records with outcome."""
+        self.records[outcome] += number
+
+    def document(self) -> dict:
+        """Return etl_runs collection document."""
+        return {
+            "pipeline": self.pipeline, "user": self.user,
+            "started": self.started, "status": self.status,
+            "duration": round(time.perf_counter() - self._start, 3),
+            "stages": {k: round(v, 3) for k, v in self.stages.items()},
+            "records": dict(self.records),
+            "carrier": {
+                "requests": len(self.latencies),
+                "p50": percentile(self.latencies, 0.5),
+                "p95": percentile(self.latencies, 0.95),
+                "p99": percentile(self.latencies, 0.99),
+            },
+        }
+
+    def increments(self) -> dict:
+        """Return $inc fields for etl_metrics document."""
+        name = self.pipeline
+        inc = {f"runs.{name}.{self.status}": 1}
+        for outcome, number in self.records.items():
+            inc[f"records.{name}.{outcome}"] = number
+        for stage, seconds in self.stages.items():
+            prefix = f"stages.{name}.{stage}"
+            for i, n in enumerate(buckets([seconds], STAGE_BUCKETS)):
+                if n:
+                    inc[f"{prefix}.b{i}"] = n
+            inc[f"{prefix}.sum"] = seconds
+            inc[f"{prefix}.count"] = 1
+        for i, n in enumerate(buckets(self.latencies, LATENCY_BUCKETS)):
+            if n:
+                inc[f"latency.b{i}"] = n
+        inc["latency.sum"] = sum(self.latencies)
+        inc["latency.count"] = len(self.latencies)
+        return inc
+
+    def save(self) -> None:
+        """Save run to database."""
+        try:
+            self.db.etl_runs.insert_one(self.document())
+            self.db.etl_metrics.update_one(
+                {"_id": "etl"}, {"$inc": self.increments()}, upsert=True
+            )
+        except BaseException as err:
+            logger.error(
+                f"Failed to save {self.pipeline} run metrics: {err}"
+            )
+
+
+def recent_runs(db: Database, limit: int = 10) -> List[dict]:
+    """Return the most recent pipeline runs."""
+    return list(db.etl_runs.find({}, {"_id": 0}).sort("started", -1)
+                .limit(limit))
+
+
+def _labels(**labels: str) -> str:
+    """Format Prometheus labels."""
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def _histogram(name: str, labels: str, data: dict, bounds: tuple) -> list:
+    """Format Prometheus histogram samples from stored buckets."""
+    lines = []
+    total = 0
+    for i, bound in enumerate(bounds + ("+Inf",)):
+        total += data.get(f"b{i}", 0)
+        label = f'{labels},le="{bound}"' if labels else f'le="{bound}"'
+        lines.append(f"{name}_bucket{{{label}}} {total}")
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {data.get('sum', 0)}")
+    lines.append(f"{name}_count{suffix} {data.get('count', 0)}")
+    return lines
+
+
+def render(db: Database) -> str:
+    """Return ETL metrics in Prometheus text format."""
+    doc = db.etl_metrics.find_one({"_id": "etl"}) or {}
+    lines = [
+        "# HELP seacargos_etl_runs_total ETL pipeline runs.",
+        "# TYPE seacargos_etl_runs_total counter",
+    ]
+    for pipeline, statuses in doc.get("runs", {}).items():
+        for status, number in statuses.items():
+            lines.append("seacargos_etl_runs_total{"
+                         f"{_labels(pipeline=pipeline, status=status)}"
+                         f"}} {number}")
+    lines += [
+        "# HELP seacargos_etl_records_total ETL records by outcome.",
+        "# TYPE seacargos_etl_records_total counter",
+    ]
+    for pipeline, outcomes in doc.get("records", {}).items():
+        for outcome, number in outcomes.items():
+            lines.append("seacargos_etl_records_total{"
+                         f"{_labels(pipeline=pipeline, outcome=outcome)}"
+                         f"}} {number}")
+    lines += [
+        "# HELP seacargos_etl_stage_seconds ETL pipeline stage duration.",
+        "# TYPE seacargos_etl_stage_seconds histogram",
+    ]
+    for pipeline, stages in doc.get("stages", {}).items():
+        for stage, data in stages.items():
+            lines += _histogram("seacargos_etl_stage_seconds",
+                                _labels(pipeline=pipeline, stage=stage),
+                                data, STAGE_BUCKETS)
+    lines += [
+        "# HELP seacargos_carrier_request_seconds Carrier request latency.",
+        "# TYPE seacargos_carrier_request_seconds histogram",
+    ]
+    lines += _histogram("seacargos_carrier_request_seconds", "",
+                        doc.get("latency", {}), LATENCY_BUCKETS)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,59 @@
+"""One-off data migrations of tracking records.
+
+Migrations update records created by previous application versions. They
+scan tracking collection and run once after deployment, not on every
+application start:
+
+    python -m etl.migrate [migration ...]
+
+All migrations run if none is named. Available migrations:
+- null_dates: replace empty string and epoch event dates with None.
+- table_rows: add dashboard table fields to records created without them.
+"""
+
+import logging
+import os
+import sys
+from typing import List
+
+from pymongo import MongoClient
+
+from etl.schedule import backfill_null_dates
+from etl.table import backfill_table_rows
+
+logger = logging.getLogger("DATABASE")
+
+# Migrations run in this order, table rows are built from normalised dates
+MIGRATIONS = {
+    "null_dates": backfill_null_dates,
+    "table_rows": backfill_table_rows,
+}
+
+
+def main(names: List[str]) -> int:
+    """Run named migrations, all if names are empty."""
+    logging.basicConfig(level=logging.INFO)
+    unknown = [name for name in names if name not in MIGRATIONS]
+    if unknown:
+        logger.error(
+            f"Unknown migrations {unknown}, available: {list(MIGRATIONS)}."
+        )
+        return 1
+    URL = os.getenv("FLASK_DB_FRONTEND_URI")
+    DB_NAME = os.getenv("FLASK_DB_NAME")
+    if not URL or not DB_NAME:
+        logger.error(
+            "Environment variables for database connection are not available"
+        )
+        return 1
+    conn = MongoClient(URL)
+    db = conn[DB_NAME]
+    for name in names or MIGRATIONS:
+        logger.info(f"Run migration {name}.")
+        MIGRATIONS[name](db)
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
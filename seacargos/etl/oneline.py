@@ -1,33 +1,54 @@
 """ETL pipeline for creating ONE container shipping records in database.
 
 This module defines ETL (Extract Transform Load) pipeline for ONE
-container shippings. Main ETL logic function is etl_one(). Other functions
-in this module are helper functions which make hard job of data extraction,
-transformation and loading to database."""
+container shippings. Main ETL logic function is etl_one(), etl_many() loads
+a batch of shipments and etl_pending() completes pending records. Other
+functions in this module are helper functions which make hard job of data
+extraction, transformation and loading to database."""
 
 import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from http import HTTPStatus
-from typing import Optional
+from typing import List, Optional, Tuple
 
-import requests
+from bson.objectid import ObjectId
 from pymongo import MongoClient
 from pymongo.database import Database
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+from requests import RequestException
+
+from etl.client import get_client
+from etl.metrics import Run, bind_run
+from etl.response_cache import ResponseCache
+from etl.schedule import next_check, schedule_hashes, transform_schedules
+from etl.table import table_fields
 
 logger = logging.getLogger("ONE ETL")
 
-URL = os.getenv("ONE_URL")
-if not URL:
-    logger.error("ONE_URL envoronment variable is not available.")
+# Concurrent requests for batch import
+WORKERS = int(os.getenv("ONE_WORKERS", 8))
+
+# Message of successfully loaded record
+ADDED = "New record successfully added"
 
+# Extract outcomes: shipment found, carrier has no such shipment or
+# carrier is unavailable (transient failure, request can be retried)
+FOUND = "found"
+NOT_FOUND = "not found"
+UNAVAILABLE = "unavailable"
 
-def extract_container_data(query: dict) -> tuple:
+
+def extract_container_data(query: dict,
+                           cache: Optional[ResponseCache] = None
+                           ) -> Tuple[str, Optional[dict]]:
     """Extract container data for ONE containers.
 
-    Make GET request and extract container data from response.
+    Make GET request (or use cached response) and extract container data
+    from response. Returns extract outcome and container data.
     """
     # Prepare payload and make get request
     payload = {
@@ -37,53 +58,66 @@ def extract_container_data(query: dict) -> tuple:
         "search_name": (query.get("bkgNo", None)
                             or query.get("cntrNo", None)), "cust_cd": "",
     }
-    r = requests.get(URL, params=payload)
-    if r.status_code != HTTPStatus.OK:
+    try:
+        status, data = get_client().fetch_json(
+            payload, cache, f"121:{payload['search_name']}"
+        )
+    except RequestException as err:
+        logger.error(f"ONE site request error for query {query}: {err}.")
+        return UNAVAILABLE, None
+    if status != HTTPStatus.OK:
         logger.warning(
             ("ONE site is unavailable with response status code: "
-             f"{r.status_code}.")
+             f"{status}.")
         )
-        return query, None
-    data = r.json()
+        return UNAVAILABLE, None
     # Extract data from response
-    if "list" in data:
+    if data.get("list"):
         container_data = data["list"][0]
         container_data.pop("hashColumns", None)
-        return query, container_data
+        return FOUND, container_data
 
     logger.warning(f"Container data is missing for query: {query}.")
-    return query, None
+    return NOT_FOUND, None
 
 
-def extract_schedule_data(query: dict,
-                          container_data: Optional[dict]) -> Optional[dict]:
+def extract_schedule_data(query: dict, container_data: Optional[dict],
+                          cache: Optional[ResponseCache] = None
+                          ) -> Tuple[str, Optional[dict]]:
     """Extract schedule data for ONE container.
 
-    Make GET request and extract schedule data from response.
+    Make GET request (or use cached response) and extract schedule data
+    from response. Returns extract outcome and raw data.
     """
     if not container_data:
         logger.warning("Container data is missing.")
-        return
+        return NOT_FOUND, None
     payload = {
         "_search": "false", "f_cmd": "125",
         "cntr_no": container_data["cntrNo"],
         "bkg_no": "", "cop_no": container_data["copNo"]
     }
-    r = requests.get(URL, params=payload)
-    if r.status_code != HTTPStatus.OK:
+    try:
+        status, data = get_client().fetch_json(
+            payload, cache, f"125:{payload['cop_no']}"
+        )
+    except RequestException as err:
+        logger.error(f"ONE site request error for query {query}: {err}.")
+        return UNAVAILABLE, None
+    if status != HTTPStatus.OK:
         logger.warning(
-            f"ONE site is unavailable, response status code: {r.status_code}."
+            f"ONE site is unavailable, response status code: {status}."
         )
-        return
-    data = r.json()
-    if "list" in data:
+        return UNAVAILABLE, None
+    if data.get("list"):
         schedule_data = data["list"]
         schedule_data[0].pop("hashColumns", None)
-        return {"container_data": container_data,
-                "schedule_data": schedule_data,
-                "query": query}
+        return FOUND, {"container_data": container_data,
+                       "schedule_data": schedule_data,
+                       "query": query}
 
     logger.warning(f"Schedule data is missing for query: {query}.")
+    return NOT_FOUND, None
 
 
 def transform_data(data: Optional[dict]) -> Optional[dict]:
@@ -104,23 +138,15 @@ def transform_data(data: Optional[dict]) -> Optional[dict]:
         )
         return
 
-    # Check required schedule keys exist in raw data
-    schedule_keys = ["no", "statusNm", "placeNm", "yardNm", "eventDt",
-                     "actTpCd", "actTpCd", "vslEngNm", "lloydNo"]
-    if not set(schedule_keys).issubset(set(data["schedule_data"][0])):
+    # Transform schedule data and check required schedule keys exist
+    transformed = transform_schedules([data["schedule_data"]])[0]
+    if transformed is None:
         logger.warning(
             ("Required container keys are missing in response data for query: "
              f"{data['query']}.")
         )
         return
 
-    def to_date_obj(string: str) -> datetime:
-        """Transform string date to datetime object."""
-        if len(string) == 0:
-            return ''
-        f_str = "%Y-%m-%d %H:%M"
-        return datetime.strptime(string, f_str)
-
     # Transform container data
     if len(data["query"]["requestedETA"]) > 1:
         data["query"]["requestedETA"] = datetime.strptime(
@@ -139,30 +165,18 @@ def transform_data(data: Optional[dict]) -> Optional[dict]:
         "trackStart": timestamp,
         "regularUpdate": timestamp,
         "recordUpdate": timestamp,
-        "trackEnd": None, "outboundTerminal": "", "departureDate": "",
-        "inboundTerminal": "", "arrivalDate": "", "vesselName": None,
+        "trackEnd": None, "outboundTerminal": "", "departureDate": None,
+        "inboundTerminal": "", "arrivalDate": None, "vesselName": None,
         "location": None, "schedule": None,
     }
 
-    # Transform schedule data
-    schedule = []
-    for i in data["schedule_data"]:
-        # Add schedule item point
-        schedule.append({
-            "no": int(i["no"]), "event": i["statusNm"],
-            "placeName": i["placeNm"], "yardName": i["yardNm"],
-            "eventDate": to_date_obj(i["eventDt"]), "status": i["actTpCd"],
-            "vesselName": i["vslEngNm"], "imo": i["lloydNo"]
-        })
-        # Find & save outbound/inbound terminals & departure/arrival dates
-        if i["statusNm"].find("Departure from Port of Loading") > -1:
-            result["outboundTerminal"] = f"{i['placeNm']} | {i['yardNm']}"
-            result["departureDate"] = to_date_obj(i["eventDt"])
-        if i["statusNm"].find("Arrival at Port of Discharging") > -1:
-            result["inboundTerminal"] = f"{i['placeNm']} | {i['yardNm']}"
-            result["arrivalDate"] = to_date_obj(i["eventDt"])
-    result["schedule"] = schedule
+    # Add schedule and outbound/inbound terminals & departure/arrival dates
+    result.update(transformed)
+    schedule = result["schedule"]
     result["initSchedule"] = schedule
+    result["scheduleHashes"] = schedule_hashes(schedule)
+    result["nextCheck"] = next_check(schedule, timestamp)
+    result.update(table_fields(result))
     return result
 
 
@@ -179,7 +193,7 @@ def load_data(data: Optional[dict], conn: MongoClient, db: Database) -> dict:
         conn.admin.command("ping")
         cursor = db.tracking.insert_one(data)
         if cursor.acknowledged:
-            return {"etl_message": "New record successfully added"}
+            return {"etl_message": ADDED}
         else:
             logger.error(
                 (f"Requested data {data['bkgNo']} not loaded to tracking "
@@ -200,8 +214,206 @@ def load_data(data: Optional[dict], conn: MongoClient, db: Database) -> dict:
 
 def etl_one(query: dict, conn: MongoClient, db: Database) -> dict:
     """ETL pipeline for ONE container shippings."""
-    _, container_data = extract_container_data(query)
-    raw_data = extract_schedule_data(query, container_data)
-    transformed_data = transform_data(raw_data)
-    result = load_data(transformed_data, conn, db)
+    with Run("register", db, query.get("user")) as run:
+        with run.stage("fetch"):
+            _, raw_data = extract_one(query, ResponseCache(db.carrier_cache))
+        with run.stage("transform"):
+            transformed_data = transform_data(raw_data)
+        with run.stage("write"):
+            result = load_data(transformed_data, conn, db)
+        run.count("added" if result.get("etl_message") == ADDED
+                  else "not added")
     return result
+
+
+def extract_one(query: dict, cache: Optional[ResponseCache] = None
+                ) -> Tuple[str, Optional[dict]]:
+    """Extract container and schedule data for one query.
+
+    Returns extract outcome (FOUND, NOT_FOUND or UNAVAILABLE) and raw data.
+    """
+    outcome, container_data = extract_container_data(query, cache)
+    if outcome != FOUND:
+        return outcome, None
+    return extract_schedule_data(query, container_data, cache)
+
+
+def etl_many(queries: List[dict], conn: MongoClient, db: Database,
+             workers: int = WORKERS) -> List[dict]:
+    """Batch ETL pipeline for ONE container shippings.
+
+    Extract data for all queries concurrently with up to `workers` threads,
+    transform and load results with one insert_many(). Returns outcome for
+    every query: {"item": number, "status": "added"|"not found"|"failed"}.
+    """
+    if not queries:
+        return []
+    with Run("import", db, queries[0].get("user")) as run:
+        outcomes = load_many(queries, conn, db, workers, run)
+        for outcome in outcomes:
+            run.count(outcome["status"])
+    return outcomes
+
+
+def safe_extract_one(query: dict, cache: Optional[ResponseCache] = None
+                     ) -> Tuple[str, Optional[dict]]:
+    """Extract one query of a batch, errors are isolated to the query."""
+    try:
+        return extract_one(query, cache)
+    except BaseException as err:
+        logger.error(f"Unexpected error for query {query}: {err}.")
+        return UNAVAILABLE, None
+
+
+def load_many(queries: List[dict], conn: MongoClient, db: Database,
+              workers: int, run: Run) -> List[dict]:
+    """Extract, transform and load queries of etl_many()."""
+    cache = ResponseCache(db.carrier_cache)
+    with run.stage("fetch"):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            extract = bind_run(partial(safe_extract_one, cache=cache))
+            raw_data = list(ex.map(extract, queries))
+    outcomes = []
+    records = []
+    with run.stage("transform"):
+        for query, (extracted, data) in zip(queries, raw_data):
+            outcome = {"item": query.get("bkgNo") or query.get("cntrNo"),
+                       "status": ("failed" if extracted == UNAVAILABLE
+                                  else "not found")}
+            outcomes.append(outcome)
+            try:
+                record = transform_data(data)
+            except BaseException as err:
+                logger.error(f"Failed to transform query {query}: {err}.")
+                outcome["status"] = "failed"
+                continue
+            if record:
+                records.append((outcome, record))
+    if not records:
+        return outcomes
+    with run.stage("write"):
+        write_many(records, conn, db)
+    return outcomes
+
+
+def write_many(records: List[tuple], conn: MongoClient,
+               db: Database) -> None:
+    """Insert (outcome, record) records and update their outcomes."""
+    try:
+        conn.admin.command("ping")
+        db.tracking.insert_many([r for _, r in records], ordered=False)
+        for outcome, _ in records:
+            outcome["status"] = "added"
+    except BulkWriteError as err:
+        failed = {e["index"] for e in err.details.get("writeErrors", [])}
+        for index, (outcome, _) in enumerate(records):
+            outcome["status"] = "failed" if index in failed else "added"
+        logger.error(f"Failed to load {len(failed)} imported records.")
+    except ConnectionFailure:
+        logger.error("Database connection failure for import write.")
+        for outcome, _ in records:
+            outcome["status"] = "failed"
+    except PyMongoError as err:
+        logger.error(f"Database error for import write: {err}.")
+        for outcome, _ in records:
+            outcome["status"] = "failed"
+
+
+def pending_record(query: dict) -> dict:
+    """Prepare pending tracking record for requested shipment.
+
+    Pending record keeps user query and a table row to display on
+    dashboard until ETL pipeline completes the record.
+    """
+    record = {
+        "cntrNo": query.get("cntrNo"), "bkgNo": query.get("bkgNo"),
+        "user": query["user"], "line": query["line"],
+        "refId": query["refId"], "requestedETA": query["requestedETA"],
+        "trackStart": datetime.now().replace(microsecond=0),
+        "trackEnd": None, "departureDate": None, "arrivalDate": None,
+        "pending": True, "query": dict(query),
+    }
+    record.update(table_fields(record))
+    record["tableRow"]["pending"] = True
+    return record
+
+
+def insert_pending(query: dict, conn: MongoClient,
+                   db: Database) -> Optional[ObjectId]:
+    """Insert pending tracking record and return its id."""
+    try:
+        conn.admin.command("ping")
+        cursor = db.tracking.insert_one(pending_record(query))
+        return cursor.inserted_id
+    except ConnectionFailure:
+        logger.error(f"Database connection failure for query {query}.")
+    except BaseException as err:
+        logger.error(f"Unexpected error for query {query}: {err}.")
+
+
+def etl_pending(record_id: ObjectId, conn: MongoClient,
+                db: Database) -> dict:
+    """ETL pipeline to complete pending ONE container shipping record.
+
+    Pending record is replaced with loaded data, or deleted if carrier does
+    not know the shipment. If carrier is unavailable or its data can not
+    be loaded, pending record is kept and marked failed, so user can retry.
+    Returns message and status: "added", "not found" or "failed".
+    """
+    record = db.tracking.find_one({"_id": record_id, "pending": True})
+    if not record:
+        logger.warning(f"Pending record {record_id} not found.")
+        return {"etl_message": "Pending record not found.",
+                "status": "failed"}
+    query = record["query"]
+    number = query.get("bkgNo") or query.get("cntrNo")
+    with Run("register", db, query.get("user")) as run:
+        with run.stage("fetch"):
+            extracted, raw_data = extract_one(
+                query, ResponseCache(db.carrier_cache)
+            )
+        with run.stage("transform"):
+            transformed_data = transform_data(raw_data)
+        with run.stage("write"):
+            if extracted == NOT_FOUND:
+                db.tracking.delete_one({"_id": record_id, "pending": True})
+                run.count("not found")
+                return {"etl_message": f"Shipment {number} not found.",
+                        "status": "not found"}
+            modified = 0
+            if transformed_data:
+                modified = db.tracking.replace_one(
+                    {"_id": record_id, "pending": True}, transformed_data
+                ).modified_count
+        if modified:
+            run.count("added")
+            return {"etl_message": f"Shipment {number} added.",
+                    "status": "added"}
+        run.count("failed")
+        mark_failed(db, record_id)
+    logger.error(f"Pending record {record_id} was not completed.")
+    return {"etl_message": (f"Shipment {number} is not added yet: ONE site "
+                            "is unavailable, please retry later."),
+            "status": "failed"}
+
+
+def mark_failed(db: Database, record_id: ObjectId) -> None:
+    """Mark pending record failed and show retry link in its table row."""
+    db.tracking.update_one(
+        {"_id": record_id, "pending": True},
+        {"$set": {"failed": True, "tableRow.failed": True,
+                  "tableRow.recordId": str(record_id)}}
+    )
+
+
+def retry_pending(record_id: ObjectId, user: str, db: Database) -> bool:
+    """Clear failed mark of user pending record before retry.
+
+    Returns False if there is no such failed record.
+    """
+    result = db.tracking.update_one(
+        {"_id": record_id, "user": user, "pending": True, "failed": True},
+        {"$unset": {"failed": "", "tableRow.failed": "",
+                    "tableRow.recordId": ""}}
+    )
+    return result.modified_count == 1
@@ -0,0 +1,141 @@
+"""Smart refresh scheduler for ONE container shipping records.
+
+Long running alternative to periodic regular_schedule_update(). Every
+active tracking record keeps the time of its next schedule check in
+nextCheck field, it is computed by etl.schedule.next_check() on every
+update: shortly before and after estimated events and rarely during long
+legs. Scheduler polls database for due records and updates only them:
+- backfill_next_check(): add nextCheck to records created without it.
+- due_chunks(): take due records in chunks and lease them.
+- run_due(): update due records and set trackEnd for arrived ones.
+Module can be run as a script: python -m etl.oneline_scheduler"""
+
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from logging.handlers import RotatingFileHandler
+from typing import Iterator, List
+
+from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.errors import ConnectionFailure
+
+from cursors import to_records
+from etl.metrics import Run
+from etl.oneline_update import (
+    CHUNK_SIZE,
+    arrival_update,
+    chunked_schedule_update,
+    records_query,
+)
+from etl.schedule import CHECK_OVERDUE
+
+logger = logging.getLogger("ONE ETL SCHEDULER")
+
+# Seconds between database polls for due records
+POLL_INTERVAL = float(os.getenv("ONE_SCHEDULER_POLL", 60))
+
+
+def due_query(now: datetime) -> dict:
+    """Return query for active records which are due for check."""
+    return {"trackEnd": None, "nextCheck": {"$lte": now}}
+
+
+def backfill_next_check(db: Database) -> int:
+    """Make active records without nextCheck field due now.
+
+    Returns number of updated records.
+    """
+    now = datetime.now().replace(microsecond=0)
+    result = db.tracking.update_many(
+        {"trackEnd": None, "pending": {"$ne": True},
+         "nextCheck": {"$exists": False}},
+        {"$set": {"nextCheck": now}}
+    )
+    if result.modified_count:
+        logger.info(f"Next check added to {result.modified_count} records.")
+    return result.modified_count
+
+
+def due_chunks(db: Database, chunk_size: int = CHUNK_SIZE,
+               lease: timedelta = CHECK_OVERDUE) -> Iterator[List[dict]]:
+    """Take due records in chunks, the most overdue first.
+
+    nextCheck of taken records is moved lease ahead before they are
+    yielded, so records which failed to update are retried later and are
+    not taken twice. Successful update sets nextCheck from new schedule.
+    """
+    _, project = records_query()
+    project["_id"] = 1
+    while True:
+        now = datetime.now().replace(microsecond=0)
+        cur = db.tracking.find(due_query(now), project,
+                               sort=[("nextCheck", 1)], limit=chunk_size)
+        chunk = to_records(cur)
+        if not chunk:
+            return
+        db.tracking.update_many(
+            {"_id": {"$in": [rec["_id"] for rec in chunk]}},
+            {"$set": {"nextCheck": now + lease}}
+        )
+        yield chunk
+
+
+def run_due(conn: MongoClient, db: Database) -> dict:
+    """Update schedules of due records.
+
+    ETL steps:
+    - Take due records from database in chunks.
+    - Extract, transform and update schedules of every chunk.
+    - Check records which arrived to destination and set 'trackEnd' field
+    equal to current date and time.
+    Returns aggregated update result, run metrics are saved to etl_runs
+    collection if any record was due.
+    """
+    with Run("scheduler", db) as run:
+        totals = chunked_schedule_update(conn, db, due_chunks(db), run=run)
+        if totals["modified"]:
+            arrival_update(conn, db, run)
+    return totals
+
+
+def run(conn: MongoClient, db: Database,
+        poll_interval: float = POLL_INTERVAL) -> None:
+    """Update due records until process is terminated."""
+    backfill_next_check(db)
+    while True:
+        try:
+            run_due(conn, db)
+        except ConnectionFailure:
+            logger.error("Database connection failure.")
+        except Exception as err:
+            logger.error(f"Unexpected error during scheduled update: {err}")
+        time.sleep(poll_interval)
+
+
+def main() -> int:
+    """Main module function for ONE shipments smart refresh."""
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=[RotatingFileHandler(
+            'logs/one_scheduler.log', maxBytes=5000000, backupCount=5)],
+        format=('%(asctime)s - %(levelname)s - %(name)s - '
+                '%(filename)s in %(funcName)s:%(lineno)s - %(message)s')
+    )
+    URL = os.getenv("FLASK_DB_FRONTEND_URI")
+    DB_NAME = os.getenv("FLASK_DB_NAME")
+    if not URL or not DB_NAME:
+        logger.error(
+            "Environment variables for database connection are not available"
+        )
+        return 1
+    conn = MongoClient(URL)
+    logger.info("Start smart refresh scheduler.")
+    run(conn, conn[DB_NAME])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
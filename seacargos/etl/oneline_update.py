@@ -9,57 +9,92 @@ belong to a specific user.
 Other functions in this module are helper functions which make hard job of
 data extraction, transformation and loading to database."""
 
-import json
 import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from http import HTTPStatus
 from logging.handlers import RotatingFileHandler
-from typing import List, Optional
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
-import requests
-from bson.json_util import dumps
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from pymongo.database import Database
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from cursors import to_records
+from etl.client import CircuitOpenError, get_client
+from etl.metrics import Run, bind_run
+from etl.response_cache import ResponseCache
+from etl.schedule import next_check, schedule_hashes, transform_schedules
+from etl.table import ROW_FIELDS, table_fields
 
 logger = logging.getLogger('ONE ETL UPDATE')
 
-URL = os.getenv("ONE_URL")
-if not URL:
-    logger.error("ONE_URL envoronment variable is not available.")
+# Concurrent schedule fetching settings
+WORKERS = int(os.getenv("ONE_WORKERS", 8))
+HOST_CONCURRENCY = int(os.getenv("ONE_HOST_CONCURRENCY", 8))
+HOST_LIMIT = threading.BoundedSemaphore(HOST_CONCURRENCY)
 
+# Rounds and minimal delay (seconds) to retry failed schedule requests
+RETRY_ROUNDS = int(os.getenv("ONE_RETRY_ROUNDS", 2))
+RETRY_DELAY = float(os.getenv("ONE_RETRY_DELAY", 5))
 
-def records_to_update(conn: MongoClient, db: Database,
-                      user: Optional[str] = None,
-                      bkg_number: Optional[str] = None) -> Optional[dict]:
-    """Prepare database records which require update.
+# Bulk write settings
+BATCH_SIZE = int(os.getenv("ONE_BULK_BATCH_SIZE", 500))
+
+# Number of records processed by update pipelines at once
+CHUNK_SIZE = int(os.getenv("ONE_CHUNK_SIZE", 200))
+
+
+def records_query(user: Optional[str] = None,
+                  bkg_number: Optional[str] = None) -> Tuple[dict, dict]:
+    """Prepare query and projection for records which require update.
 
     Supports three options:
     - Update all user records: user='username'
     - Update one user record: user='username' and bkg_number='number'
     - Bulk update (all users records): user=None and bkg_number=None
     """
-    # Prepare query
-    project = {"user": 1, "bkgNo": 1, "copNo": 1, "_id": 0}
+    project = {"user": 1, "bkgNo": 1, "copNo": 1, "scheduleHashes": 1,
+               "_id": 0}
+    # Current table row fields are updated by transform()
+    project.update({field: 1 for field in ROW_FIELDS})
     query = {"trackEnd": None}
     if user and bkg_number:
         query["user"] = user
         query["bkgNo"] = bkg_number
+        # Pending records are completed by registration jobs
+        query["pending"] = {"$ne": True}
     elif user:
         query["user"] = user
+        # Pending records are completed by registration jobs
+        query["pending"] = {"$ne": True}
     else:
         now = datetime.now().replace(microsecond=0)
         query["schedule"] = {
             "$elemMatch": {"status": "E", "eventDate": {"$lte": now}}
         }
         project.pop("user")
+    return query, project
+
+
+def records_to_update(conn: MongoClient, db: Database,
+                      user: Optional[str] = None,
+                      bkg_number: Optional[str] = None) -> Optional[dict]:
+    """Prepare database records which require update.
+
+    Supports the same options as records_query().
+    """
+    query, project = records_query(user, bkg_number)
     # Run query
     try:
         conn.admin.command("ping")
         cur = db.tracking.find(query, project)
-        records = json.loads(dumps(cur))
+        records = to_records(cur)
         if len(records) > 0:
             return records
         else:
@@ -73,130 +108,299 @@ def records_to_update(conn: MongoClient, db: Database,
         return
 
 
-def extract_schedule_details(records: Optional[dict]) -> Optional[dict]:
-    """Extract schedule data for ONE container records.
+def iter_records_to_update(conn: MongoClient, db: Database,
+                           user: Optional[str] = None,
+                           chunk_size: int = CHUNK_SIZE
+                           ) -> Iterator[List[dict]]:
+    """Stream database records which require update in chunks.
 
-    Make GET request to extract container schedule data for update.
+    Supports bulk update (user=None) and update of all user records
+    (user='username'). Records are read from a single cursor and yielded
+    in lists of up to chunk_size records.
     """
-    if not records:
-        return
-    # Extract data
-    for rec in records:
-        # Prepare request payload
-        payload = {
-            '_search': 'false', 'f_cmd': '125', 'cntr_no': "",
-            'bkg_no': rec["bkgNo"], 'cop_no': rec["copNo"]
-        }
-        # Make request
-        r = requests.get(URL, params=payload)
-        if r.status_code != HTTPStatus.OK:
-            logger.warning(
-                ("ONE site is unavailable with response status code: "
-                 f"{r.status_code}.")
+    query, project = records_query(user)
+    count = 0
+    try:
+        conn.admin.command("ping")
+        cur = db.tracking.find(query, project, batch_size=chunk_size)
+        chunk = []
+        for rec in cur:
+            chunk.append(rec)
+            if len(chunk) == chunk_size:
+                count += len(chunk)
+                yield chunk
+                chunk = []
+        if chunk:
+            count += len(chunk)
+            yield chunk
+        if count == 0:
+            logger.info(f"Nothing to update for query: {query}.")
+    except ConnectionFailure:
+        logger.error(f"Database connection failure for query: {query}.")
+    except BaseException as err:
+        logger.error(f"Unexpected error for query {query}: {err}.")
+
+
+def fetch_schedule(rec: dict, cache: Optional[ResponseCache] = None) -> dict:
+    """Fetch schedule data for a single ONE container record.
+
+    Make GET request (or use cached response) and update record with raw
+    schedule data. Request errors are logged and isolated to the record:
+    rec["schedule"] is set to None so the rest of the batch is not affected
+    and rec["retry"] is set to True if request can be retried.
+    """
+    # Prepare request payload
+    payload = {
+        '_search': 'false', 'f_cmd': '125', 'cntr_no': "",
+        'bkg_no': rec["bkgNo"], 'cop_no': rec["copNo"]
+    }
+    # Make request within per-host concurrency limit
+    try:
+        with HOST_LIMIT:
+            status, data = get_client().fetch_json(
+                payload, cache, f"125:{rec['copNo']}"
             )
-            return
-        data = r.json()
-        # Update schedule data
-        if "list" in data:
-            schedule_data = data["list"]
-            schedule_data[0].pop("hashColumns", None)
-            rec["schedule"] = schedule_data
-        else:
+        if status != HTTPStatus.OK:
             logger.warning(
-                f"Schedule data is missing for record: {rec['bkgNo']}"
+                ("ONE site is unavailable with response status code: "
+                 f"{status} for record: {rec['bkgNo']}.")
             )
             rec["schedule"] = None
+            rec["retry"] = True
+            return rec
+    except CircuitOpenError:
+        rec["schedule"] = None
+        rec["retry"] = True
+        return rec
+    except BaseException as err:
+        logger.error(
+            f"Unexpected error for record {rec['bkgNo']} request: {err}."
+        )
+        rec["schedule"] = None
+        rec["retry"] = True
+        return rec
+    # Update schedule data
+    if "list" in data:
+        schedule_data = data["list"]
+        schedule_data[0].pop("hashColumns", None)
+        rec["schedule"] = schedule_data
+    else:
+        logger.warning(
+            f"Schedule data is missing for record: {rec['bkgNo']}"
+        )
+        rec["schedule"] = None
+    return rec
+
+
+def extract_schedule_details(records: Optional[dict],
+                             workers: int = WORKERS,
+                             cache: Optional[ResponseCache] = None,
+                             retry_rounds: int = RETRY_ROUNDS
+                             ) -> Optional[dict]:
+    """Extract schedule data for ONE container records.
+
+    Make GET requests to extract container schedule data for update.
+    Requests run in a thread pool with up to `workers` threads, workers=1
+    keeps the serial mode. Each record is updated in place. Optional cache
+    is used to skip requests for recently fetched schedules. Failed requests
+    are requeued for up to retry_rounds rounds, every round waits at least
+    RETRY_DELAY seconds or until circuit breaker allows requests.
+    """
+    if not records:
+        return
+    queue = records
+    for attempt in range(retry_rounds + 1):
+        if attempt:
+            time.sleep(max(RETRY_DELAY, get_client().breaker.remaining()))
+            logger.info(
+                f"Retry round {attempt}: {len(queue)} schedule requests."
+            )
+        fetch_schedules(queue, workers, cache)
+        queue = [rec for rec in queue if rec.pop("retry", False)]
+        if not queue:
+            break
+    if queue:
+        logger.warning(f"Schedule requests failed for {len(queue)} records.")
     return records
 
 
-def str_to_date(string: str) -> datetime:
-    """Convert string to date."""
-    if len(string) == 16:
-        return datetime.strptime(string, "%Y-%m-%d %H:%M")
-    return datetime.fromtimestamp(0)
+def fetch_schedules(records: List[dict], workers: int = WORKERS,
+                    cache: Optional[ResponseCache] = None) -> None:
+    """Fetch schedules for records in a thread pool of `workers` threads."""
+    if workers <= 1 or len(records) == 1:
+        for rec in records:
+            fetch_schedule(rec, cache)
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, len(records))) as ex:
+        # Consume results to wait for all requests
+        list(ex.map(bind_run(partial(fetch_schedule, cache=cache)),
+                    records))
 
 
 def transform(records: Optional[dict]) -> Optional[dict]:
     """Transforms ONE container records raw data.
 
     Prepare raw data extracted from ONE shipper for updating in database.
+    Schedules of all records are transformed at once.
     """
     # Check input
     if not records:
         return
 
-    # Transform raw data
-    schedule_keys = ["no", "statusNm", "placeNm", "yardNm",
-                     "eventDt", "actTpCd", "actTpCd", "vslEngNm",
-                     "lloydNo"]
-    for rec in records:
+    # Skip records without extracted schedule
+    extracted = [rec for rec in records if rec["schedule"]]
+    results = transform_schedules([rec["schedule"] for rec in extracted])
+    for rec, result in zip(extracted, results):
         # Check required schedule keys exist in raw data
-        if not set(schedule_keys).issubset(set(rec["schedule"][0])):
+        if result is None:
             logger.warning(
                 ("Required schedule keys are missing in response data for "
                  f"database record {rec['bkgNo']}.")
             )
             rec["schedule"] = None
             continue
-        # Transform record raw data
-        transformed_schedule = []
-        for i in rec["schedule"]:
-            transformed_schedule.append(
-                {"no": int(i["no"]),
-                 "event": i["statusNm"],
-                 "placeName": i["placeNm"],
-                 "yardName": i["yardNm"],
-                 "eventDate": str_to_date(i["eventDt"]),
-                 "status": i["actTpCd"],
-                 "vesselName": i["vslEngNm"],
-                 "imo": i["lloydNo"]}
-            )
-            # Update arrival/departure dates and terminals
-            if i["statusNm"].find("Departure from Port of Loading") > -1:
-                rec["departureDate"] = str_to_date(i["eventDt"])
-                rec["outboundTerminal"] = f"{i['placeNm']} | {i['yardNm']}"
-            if i["statusNm"].find("Arrival at Port of Discharging") > -1:
-                rec["arrivalDate"] = str_to_date(i["eventDt"])
-                rec["inboundTerminal"] = f"{i['placeNm']} | {i['yardNm']}"
-            rec["schedule"] = transformed_schedule
+        # Update schedule, arrival/departure dates and terminals
+        rec.update(result)
     return records
 
 
+def bulk_update(db: Database, operations: List[Tuple[str, UpdateOne]],
+                stamp: Tuple[str, datetime],
+                batch_size: int = BATCH_SIZE) -> Tuple[dict, List[str]]:
+    """Run update operations on tracking collection in bulk.
+
+    Operations are passed as a list of (bkgNo, UpdateOne) tuples and are
+    sent in unordered bulk writes of batch_size. Every operation must set
+    stamp=(field, value), it is used to find records which were not matched.
+    Returns aggregated result and a list of booking numbers which were not
+    updated.
+    """
+    result = {"matched": 0, "modified": 0, "failed": 0}
+    not_updated = []
+    for start in range(0, len(operations), batch_size):
+        batch = operations[start:start + batch_size]
+        failed = []
+        try:
+            res = db.tracking.bulk_write([op for _, op in batch],
+                                         ordered=False)
+            matched, modified = res.matched_count, res.modified_count
+        except BulkWriteError as err:
+            matched = err.details.get("nMatched", 0)
+            modified = err.details.get("nModified", 0)
+            for write_error in err.details.get("writeErrors", []):
+                bkg_number = batch[write_error["index"]][0]
+                failed.append(bkg_number)
+                logger.error(
+                    (f"Write error for record {bkg_number}: "
+                     f"{write_error.get('errmsg')}")
+                )
+        logger.info(
+            (f"Bulk write batch {start // batch_size + 1}: matched {matched}, "
+             f"modified {modified}, failed {len(failed)}.")
+        )
+        result["matched"] += matched
+        result["modified"] += modified
+        result["failed"] += len(failed)
+        # Find records which were not matched
+        if matched + len(failed) < len(batch):
+            keys = [bkg_number for bkg_number, _ in batch
+                    if bkg_number not in failed]
+            cur = db.tracking.find(
+                {"bkgNo": {"$in": keys}, stamp[0]: stamp[1]},
+                {"bkgNo": 1, "_id": 0}
+            )
+            updated = {c["bkgNo"] for c in cur}
+            not_updated.extend(k for k in keys if k not in updated)
+    return result, not_updated
+
+
+def schedule_changes(rec: dict) -> Optional[dict]:
+    """Prepare $set fields for changed schedule of the record.
+
+    Compares new schedule event hashes with the stored ones. Returns None
+    if schedule did not change, only changed schedule events if number of
+    events is the same or the whole schedule otherwise.
+    """
+    hashes = schedule_hashes(rec["schedule"])
+    stored = rec.get("scheduleHashes")
+    if hashes == stored:
+        return
+    fields = {"scheduleHashes": hashes}
+    if stored and len(stored) == len(hashes):
+        for i, (new, old) in enumerate(zip(hashes, stored)):
+            if new != old:
+                fields[f"schedule.{i}"] = rec["schedule"][i]
+    else:
+        fields["schedule"] = rec["schedule"]
+    return fields
+
+
 def update(conn: MongoClient, db: Database, records: Optional[dict],
-           regular_update: bool = True) -> None:
-    """Update records in database."""
+           regular_update: bool = True,
+           batch_size: int = BATCH_SIZE) -> Optional[dict]:
+    """Update records in database.
+
+    Records with unchanged schedule are not rewritten: regular update only
+    sets regularUpdate and nextCheck fields, user update skips them.
+    Changed records get only changed schedule events and nextCheck. Records
+    are written in unordered bulk writes of batch_size. Returns aggregated
+    bulk write result with number of unchanged and partially updated
+    records.
+    """
     if not records:
         return
-    query = {"bkgNo": None, "trackEnd": None}
-    update = {"$set": {"schedule": None,
-                       "recordUpdate": datetime.now().replace(microsecond=0)}
-              }
-    if regular_update:
-        update["$set"]["regularUpdate"] = update["$set"]["recordUpdate"]
+    timestamp = datetime.now().replace(microsecond=0)
+    stamp = ("regularUpdate" if regular_update else "recordUpdate",
+             timestamp)
     update_keys = ["departureDate", "outboundTerminal", "arrivalDate",
                    "inboundTerminal"]
+    operations = []
+    users = {}
+    unchanged = partially = 0
+    for rec in records:
+        if not rec["schedule"]:
+            logger.warning(
+                (f"Record with booking number {rec['bkgNo']} has not been "
+                 "updated, schedule data is missing.")
+            )
+            continue
+        query = {"bkgNo": rec["bkgNo"], "trackEnd": None}
+        if "user" in rec:
+            query["user"] = users[rec["bkgNo"]] = rec["user"]
+        changes = schedule_changes(rec)
+        if changes is None:
+            unchanged += 1
+            if regular_update:
+                operations.append((rec["bkgNo"], UpdateOne(
+                    query, {"$set": {
+                        "regularUpdate": timestamp,
+                        "nextCheck": next_check(rec["schedule"], timestamp)
+                    }}
+                )))
+            continue
+        if "schedule" not in changes:
+            partially += 1
+        update = {"$set": changes}
+        update["$set"]["recordUpdate"] = timestamp
+        update["$set"]["nextCheck"] = next_check(rec["schedule"], timestamp)
+        if regular_update:
+            update["$set"]["regularUpdate"] = timestamp
+        for key in update_keys:
+            if key in rec:
+                update["$set"][key] = rec[key]
+        update["$set"].update(table_fields(rec))
+        operations.append((rec["bkgNo"], UpdateOne(query, update)))
     try:
         conn.admin.command("ping")
-        for rec in records:
-            if not rec["schedule"]:
-                logger.warning(
-                    (f"Record with booking number {rec['bkgNo']} has not been "
-                     "updated, schedule data is missing.")
-                )
-                continue
-            query["bkgNo"] = rec["bkgNo"]
-            update["$set"]["schedule"] = rec["schedule"]
-            if "user" in rec:
-                query["user"] = rec["user"]
-            for key in update_keys:
-                if key in rec:
-                    update["$set"][key] = rec[key]
-            cursor = db.tracking.update_one(query, update)
-            if not cursor.raw_result["updatedExisting"]:
-                logger.info(
-                    (f"Update status for record {rec['bkgNo']} and "
-                     f"user {rec.get('user', None)}: {cursor.raw_result}")
-                )
+        result, not_updated = bulk_update(db, operations, stamp, batch_size)
+        for bkg_number in not_updated:
+            logger.info(
+                (f"Update status for record {bkg_number} and "
+                 f"user {users.get(bkg_number, None)}: not matched")
+            )
+        result["unchanged"] = unchanged
+        result["partial"] = partially
+        return result
     except ConnectionFailure:
         logger.error("Database connection failure for update operation.")
     except BaseException as err:
@@ -222,7 +426,7 @@ def arrived(conn: MongoClient, db: Database,
             {"$match": {"last.status": "A"}},
             {"$project": {"bkgNo": 1, "_id": 0}}
         ])
-        records = json.loads(dumps(cur))
+        records = to_records(cur)
         if len(records) > 0:
             return records
     except ConnectionFailure:
@@ -232,34 +436,91 @@ def arrived(conn: MongoClient, db: Database,
 
 
 def track_end(conn: MongoClient, db: Database,
-              records: Optional[List[dict]]) -> None:
+              records: Optional[List[dict]],
+              batch_size: int = BATCH_SIZE) -> Optional[dict]:
     """Update trackEnd field in database.
 
     Set trackEnd field to current date and time for records passed in
-    a list: records=[{record1}, {record2}...].
+    a list: records=[{record1}, {record2}...]. Records are written in
+    unordered bulk writes of batch_size. Returns aggregated bulk write
+    result.
     """
     if not records:
         return
+    timestamp = datetime.now().replace(microsecond=0)
+    operations = [
+        (rec["bkgNo"], UpdateOne({"bkgNo": rec["bkgNo"], "trackEnd": None},
+                                 {"$set": {"trackEnd": timestamp}}))
+        for rec in records
+    ]
     try:
         conn.admin.command("ping")
-        query = {"bkgNo": None, "trackEnd": None}
-        for rec in records:
-            query["bkgNo"] = rec["bkgNo"]
-            cursor = db.tracking.update_one(
-                query,
-                {"$set": {"trackEnd": datetime.now().replace(microsecond=0)}},
-            )
-            if not cursor.raw_result["updatedExisting"]:
-                logger.error(
-                    (f"Failed to set trackEnd for record {rec['bkgNo']} "
-                     f"{cursor.raw_result}")
-                )
+        result, not_updated = bulk_update(
+            db, operations, ("trackEnd", timestamp), batch_size
+        )
+        for bkg_number in not_updated:
+            logger.error(f"Failed to set trackEnd for record {bkg_number}.")
+        return result
     except ConnectionFailure:
         logger.error("Database connection failure.")
     except BaseException as err:
         logger.error(f"Unexpected error during database query: {err}")
 
 
+def chunked_schedule_update(conn: MongoClient, db: Database,
+                            chunks: Iterable[List[dict]],
+                            regular_update: bool = True,
+                            progress: Optional[Callable[[int], None]] = None,
+                            run: Optional[Run] = None) -> dict:
+    """Run extract, transform and update steps chunk by chunk.
+
+    Every chunk is written to database before the next one is extracted,
+    so memory usage does not depend on the number of records. Optional
+    progress callback receives number of processed records after every
+    chunk. Stage durations and record outcomes are added to optional run
+    metrics. Returns aggregated update result.
+    """
+    run = run or Run("chunked", db)
+    processed = 0
+    totals = {"matched": 0, "modified": 0, "failed": 0, "unchanged": 0,
+              "partial": 0}
+    cache = ResponseCache(db.carrier_cache)
+    for chunk in chunks:
+        with run.stage("fetch"):
+            raw_data = extract_schedule_details(chunk, cache=cache)
+        with run.stage("transform"):
+            transformed_data = transform(raw_data)
+        with run.stage("write"):
+            result = update(conn, db, transformed_data, regular_update)
+        for key, value in (result or {}).items():
+            totals[key] += value
+        processed += len(chunk)
+        run.count("processed", len(chunk))
+        run.count("missing", sum(1 for rec in chunk if not rec["schedule"]))
+        if progress:
+            progress(processed)
+    run.count("modified", totals["modified"])
+    run.count("unchanged", totals["unchanged"])
+    run.count("failed", totals["failed"])
+    if processed:
+        logger.info(
+            (f"Processed {processed} records: {totals['unchanged']} "
+             "unchanged schedules not rewritten, "
+             f"{totals['partial']} partially updated, "
+             f"{totals['modified']} modified.")
+        )
+    return totals
+
+
+def arrival_update(conn: MongoClient, db: Database, run: Run,
+                   user: Optional[str] = None) -> None:
+    """Set trackEnd for arrived records and measure arrival stage."""
+    with run.stage("arrival"):
+        result = track_end(conn, db, arrived(conn, db, user))
+    if result:
+        run.count("arrived", result["modified"])
+
+
 def regular_schedule_update(conn, db) -> None:
     """Update all ONE shipping records schedules in database.
 
@@ -270,17 +531,18 @@ def regular_schedule_update(conn, db) -> None:
     - Update the records with new data.
     - Check records which arrived to destination and set 'trackEnd' field
     equal to current date and time.
+    Records are streamed from database and processed in chunks. Run
+    metrics are saved to etl_runs collection.
     """
-    records = records_to_update(conn, db)
-    raw_data = extract_schedule_details(records)
-    transformed_data = transform(raw_data)
-    update(conn, db, transformed_data)
-    arrived_records = arrived(conn, db)
-    track_end(conn, db, arrived_records)
+    with Run("regular", db) as run:
+        chunked_schedule_update(conn, db, iter_records_to_update(conn, db),
+                                run=run)
+        arrival_update(conn, db, run)
 
 
-def user_schedule_update(conn: MongoClient, db: Database,
-                         user: str) -> None:
+def user_schedule_update(conn: MongoClient, db: Database, user: str,
+                         progress: Optional[Callable[[int], None]] = None
+                         ) -> None:
     """Update all ONE shipping records schedules for a single user.
 
     ETL steps:
@@ -290,13 +552,15 @@ def user_schedule_update(conn: MongoClient, db: Database,
     - Update the records with new data.
     - Check records which arrived to destination and set 'trackEnd' field
     equal to current date and time.
+    Records are streamed from database and processed in chunks, progress
+    callback receives number of processed records after every chunk. Run
+    metrics are saved to etl_runs collection.
     """
-    records = records_to_update(conn, db, user)
-    raw_data = extract_schedule_details(records)
-    transformed_data = transform(raw_data)
-    update(conn, db, transformed_data)
-    arrived_records = arrived(conn, db, user)
-    track_end(conn, db, arrived_records)
+    with Run("user", db, user) as run:
+        chunked_schedule_update(conn, db,
+                                iter_records_to_update(conn, db, user),
+                                progress=progress, run=run)
+        arrival_update(conn, db, run, user)
 
 
 def record_schedule_update(conn: MongoClient, db: Database,
@@ -309,11 +573,12 @@ def record_schedule_update(conn: MongoClient, db: Database,
     - Extract schedule data for the selected record.
     - Transform extracted data.
     - Update the record with new data.
+    Run metrics are saved to etl_runs collection.
     """
-    records = records_to_update(conn, db, user, bkg_number)
-    raw_data = extract_schedule_details(records)
-    transformed_data = transform(raw_data)
-    update(conn, db, transformed_data, regular_update=False)
+    with Run("record", db, user) as run:
+        records = records_to_update(conn, db, user, bkg_number)
+        chunked_schedule_update(conn, db, [records] if records else [],
+                                regular_update=False, run=run)
 
 
 def main() -> int:
@@ -0,0 +1,46 @@
+"""MongoDB backed cache of carrier responses.
+
+Responses are stored in carrier_cache collection by request key. Cached
+response is used without request during freshness window, later it is
+revalidated with ETag / Last-Modified headers if carrier sent them. Old
+entries are removed by TTL index on fetchedAt field."""
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.collection import Collection
+
+FRESHNESS = int(os.getenv("ONE_CACHE_FRESHNESS", 300))
+
+
+class ResponseCache:
+    """Carrier responses cache stored in MongoDB collection."""
+
+    def __init__(self, collection: Collection,
+                 freshness: int = FRESHNESS) -> None:
+        self.collection = collection
+        self.freshness = timedelta(seconds=freshness)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return cached entry or None."""
+        return self.collection.find_one({"_id": key})
+
+    def is_fresh(self, entry: dict) -> bool:
+        """Check if entry can be used without revalidation."""
+        return entry["fetchedAt"] + self.freshness > datetime.now()
+
+    def store(self, key: str, data: dict, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> None:
+        """Save response data with validators."""
+        self.collection.replace_one(
+            {"_id": key},
+            {"data": data, "etag": etag, "lastModified": last_modified,
+             "fetchedAt": datetime.now()},
+            upsert=True
+        )
+
+    def touch(self, key: str) -> None:
+        """Mark entry revalidated now."""
+        self.collection.update_one({"_id": key},
+                                   {"$set": {"fetchedAt": datetime.now()}})
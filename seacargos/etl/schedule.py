@@ -0,0 +1,163 @@
+"""Schedule helpers shared by ONE ETL pipelines.
+
+Raw ONE schedules of both pipelines are normalised by transform_schedules()
+a chunk at a time: required keys are checked once per record with a
+prebuilt key set, every distinct event date and event name of the chunk is
+parsed and matched once. Event dates are datetime objects or None if they
+are missing or malformed, never empty strings or epoch, so schedules are
+rendered without type checks."""
+
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo.database import Database
+
+logger = logging.getLogger("ONE ETL")
+
+# Next check settings for smart refresh scheduler, hours
+CHECK_BEFORE = timedelta(hours=float(os.getenv("ONE_CHECK_BEFORE", 6)))
+CHECK_AFTER = timedelta(hours=float(os.getenv("ONE_CHECK_AFTER", 0.5)))
+CHECK_OVERDUE = timedelta(hours=float(os.getenv("ONE_CHECK_OVERDUE", 1)))
+CHECK_MAX = timedelta(hours=float(os.getenv("ONE_CHECK_MAX", 48)))
+
+# Raw ONE schedule event keys required by transform
+RAW_EVENT_KEYS = frozenset(["no", "statusNm", "placeNm", "yardNm", "eventDt",
+                            "actTpCd", "vslEngNm", "lloydNo"])
+
+# Event name matchers: (name substring, date field, terminal field)
+EVENT_MATCHERS = (
+    ("Departure from Port of Loading", "departureDate", "outboundTerminal"),
+    ("Arrival at Port of Discharging", "arrivalDate", "inboundTerminal"),
+)
+
+
+def event_hash(event: dict) -> str:
+    """Return short content hash of transformed schedule event."""
+    data = repr(sorted(event.items())).encode()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def schedule_hashes(schedule: List[dict]) -> List[str]:
+    """Return content hashes of transformed schedule events.
+
+    Hashes are stored with the schedule (scheduleHashes field) and are
+    used to find out if schedule or any of its events changed.
+    """
+    return [event_hash(event) for event in schedule]
+
+
+def next_check(schedule: List[dict], now: datetime) -> datetime:
+    """Return time of the next schedule check for transformed schedule.
+
+    Schedule is checked CHECK_BEFORE the next upcoming estimated event and
+    CHECK_AFTER it. Overdue events are checked at least every CHECK_OVERDUE
+    with backoff for long overdue ones, the earlier of both checks is used.
+    Long legs without events (and schedules without estimated events) are
+    checked every CHECK_MAX.
+    """
+    estimated = [event["eventDate"] for event in schedule
+                 if event["status"] == "E" and event["eventDate"]]
+    checks = [now + CHECK_MAX]
+    upcoming = [date for date in estimated if date >= now]
+    if upcoming:
+        delta = min(upcoming) - now
+        if delta > CHECK_BEFORE:
+            checks.append(now + delta - CHECK_BEFORE)
+        else:
+            checks.append(now + delta + CHECK_AFTER)
+    overdue = [date for date in estimated if date < now]
+    if overdue:
+        # Backoff of the most recent overdue event
+        delta = now - max(overdue)
+        checks.append(now + max(delta / 4, CHECK_OVERDUE))
+    return min(checks)
+
+
+def parse_dates(strings: Iterable[str]) -> Dict[str, Optional[datetime]]:
+    """Parse ONE event dates ('YYYY-MM-DD HH:MM') at once.
+
+    Every distinct string is parsed once with fixed width check. Returns
+    mapping of strings to datetime objects or None if string is empty or
+    malformed.
+    """
+    dates = {}
+    for string in set(strings):
+        try:
+            dates[string] = (datetime.fromisoformat(string)
+                             if len(string) == 16 else None)
+        except ValueError:
+            dates[string] = None
+    return dates
+
+
+def match_events(names: Iterable[str]) -> Dict[str, Optional[tuple]]:
+    """Return mapping of distinct event names to EVENT_MATCHERS items."""
+    matches = {}
+    for name in set(names):
+        matches[name] = next(
+            (matcher for matcher in EVENT_MATCHERS if matcher[0] in name),
+            None
+        )
+    return matches
+
+
+def transform_schedules(raw_schedules: List[List[dict]]
+                        ) -> List[Optional[dict]]:
+    """Transform raw ONE schedules of a chunk of records.
+
+    Returns a list with transformed schedule (schedule field) and
+    departure / arrival dates and terminals found in it for every raw
+    schedule, or None if required keys are missing.
+    """
+    valid = [raw if raw and RAW_EVENT_KEYS <= raw[0].keys() else None
+             for raw in raw_schedules]
+    raw_events = [event for raw in valid if raw for event in raw]
+    dates = parse_dates([event["eventDt"] for event in raw_events])
+    matches = match_events([event["statusNm"] for event in raw_events])
+    results = []
+    for raw in valid:
+        if raw is None:
+            results.append(None)
+            continue
+        fields = {}
+        schedule = []
+        for event in raw:
+            date = dates[event["eventDt"]]
+            schedule.append({
+                "no": int(event["no"]), "event": event["statusNm"],
+                "placeName": event["placeNm"], "yardName": event["yardNm"],
+                "eventDate": date, "status": event["actTpCd"],
+                "vesselName": event["vslEngNm"], "imo": event["lloydNo"],
+            })
+            matcher = matches[event["statusNm"]]
+            if matcher:
+                fields[matcher[1]] = date
+                fields[matcher[2]] = f"{event['placeNm']} | {event['yardNm']}"
+        fields["schedule"] = schedule
+        results.append(fields)
+    return results
+
+
+def backfill_null_dates(db: Database) -> int:
+    """Replace empty string and epoch dates of tracking records with None.
+
+    Returns number of updated records.
+    """
+    missing = {"$in": ["", datetime.fromtimestamp(0)]}
+    updated = 0
+    for field in ("schedule", "initSchedule"):
+        updated += db.tracking.update_many(
+            {f"{field}.eventDate": missing},
+            {"$set": {f"{field}.$[e].eventDate": None}},
+            array_filters=[{"e.eventDate": missing}]
+        ).modified_count
+    for field in ("departureDate", "arrivalDate"):
+        updated += db.tracking.update_many(
+            {field: missing}, {"$set": {field: None}}
+        ).modified_count
+    if updated:
+        logger.info(f"Missing dates set to None in {updated} updates.")
+    return updated
@@ -0,0 +1,95 @@
+"""Dashboard table rows for ONE container shipping records.
+
+ETL pipelines store a ready to render table row in every tracking record
+(tableRow field) whenever record schedule changes, so dashboard does not
+format records on every request. Numeric ETA delay is stored separately
+(etaDelay field) to sort and paginate dashboard table."""
+
+import logging
+from datetime import datetime
+from typing import Optional
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+logger = logging.getLogger("ONE ETL")
+
+# Fields which are required to build table row
+ROW_FIELDS = ["refId", "bkgNo", "cntrNo", "cntrType", "outboundTerminal",
+              "departureDate", "inboundTerminal", "arrivalDate",
+              "requestedETA"]
+
+
+def _date(value: Optional[datetime], format_string: str) -> str:
+    """Format date or return empty string."""
+    if value is None:
+        return ""
+    return value.strftime(format_string)
+
+
+def _days(end: Optional[datetime], start: Optional[datetime]):
+    """Return days between dates or '-' if any date is missing."""
+    if end is None or start is None:
+        return "-"
+    return (end - start).days
+
+
+def table_row(record: dict) -> dict:
+    """Prepare dashboard table row for tracking record."""
+    format_string = "%d-%m-%Y %H:%M"
+    outbound = record.get("outboundTerminal") or ""
+    inbound = record.get("inboundTerminal") or ""
+    # Requested ETA is '-' if user did not set it
+    requested_eta = record.get("requestedETA")
+    eta = requested_eta if isinstance(requested_eta, datetime) else None
+    return {
+        "refId": record.get("refId"),
+        "booking": record.get("bkgNo"), "container": record.get("cntrNo"),
+        "type": record.get("cntrType"),
+        "from": {"location": outbound.split("|")[0],
+                 "terminal": outbound.split("|")[-1]},
+        "departure": _date(record.get("departureDate"), format_string),
+        "to": {"location": inbound.split("|")[0],
+               "terminal": inbound.split("|")[-1]},
+        "arrival": _date(record.get("arrivalDate"), format_string),
+        "totalDays": _days(record.get("arrivalDate"),
+                           record.get("departureDate")),
+        "requestedETA": _date(eta, "%d-%m-%Y") or requested_eta or "-",
+        "etaDelay": _days(record.get("arrivalDate"), eta),
+    }
+
+
+def table_fields(record: dict) -> dict:
+    """Prepare table fields to store in tracking record.
+
+    Returns table row and numeric etaDelay field (None if not available)
+    which is used to sort table by ETA delay.
+    """
+    row = table_row(record)
+    eta_delay = row["etaDelay"] if row["etaDelay"] != "-" else None
+    return {"tableRow": row, "etaDelay": eta_delay}
+
+
+def backfill_table_rows(db: Database, batch_size: int = 500) -> int:
+    """Add table fields to tracking records created without them.
+
+    Returns number of updated records.
+    """
+    project = {field: 1 for field in ROW_FIELDS}
+    cursor = db.tracking.find({"etaDelay": {"$exists": False}}, project,
+                              batch_size=batch_size)
+    operations = []
+    updated = 0
+    for rec in cursor:
+        operations.append(UpdateOne({"_id": rec["_id"]},
+                                    {"$set": table_fields(rec)}))
+        if len(operations) == batch_size:
+            updated += db.tracking.bulk_write(operations,
+                                              ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += db.tracking.bulk_write(operations,
+                                          ordered=False).modified_count
+    if updated:
+        logger.info(f"Table rows added to {updated} tracking records.")
+    return updated
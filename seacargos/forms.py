@@ -1,10 +1,12 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileAllowed, FileField
 from wtforms import (
     DateField,
     PasswordField,
     SelectField,
     StringField,
     SubmitField,
+    TextAreaField,
     validators,
 )
 
@@ -66,3 +68,15 @@ class TrackingForm(FlaskForm):
     requested_eta = DateField("Requested ETA",
                               validators=[validators.optional()])
     submit = SubmitField("Add")
+
+
+class ImportForm(FlaskForm):
+    """Import new tracking records form.
+
+    Every line of text or CSV file is: number[,refId[,requestedETA]].
+    """
+    items = TextAreaField("Booking or container numbers",
+                          validators=[validators.optional()])
+    file = FileField("CSV file",
+                     validators=[FileAllowed(["csv", "txt"], "CSV only.")])
+    submit = SubmitField("Import")
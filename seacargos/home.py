@@ -12,6 +12,7 @@ from flask import (
 )
 from werkzeug.security import check_password_hash
 
+from cache import TTLCache
 from db import db_conn
 from forms import LoginForm
 
@@ -19,15 +20,33 @@ bp = Blueprint("home", __name__)
 logger = logging.getLogger("WEB APP")
 
 
+# Logged in users cache, invalidated by admin views on user changes
+USER_TTL = 60
+user_cache = TTLCache(ttl=USER_TTL)
+
+
 @bp.before_app_request
 def load_logged_in_user():
-    """Loads logged in user from session to g object."""
+    """Loads logged in user from session to g object.
+
+    Users are cached by id during USER_TTL seconds, so most requests do not
+    query database.
+    """
     user_id = session.get("user_id")
     if user_id is None:
         g.user = None
-    else:
+        return
+    g.user = user_cache.get(user_id)
+    if g.user is None:
         db = db_conn()[g.db_name]
         g.user = db.users.find_one({"_id": ObjectId(user_id)})
+        if g.user is not None:
+            user_cache.set(user_id, g.user)
+
+
+def invalidate_user(name: str) -> None:
+    """Remove user from logged in users cache."""
+    user_cache.invalidate_if(lambda user: user["name"] == name)
 
 
 @bp.route("/", methods=("GET", "POST"))
@@ -71,5 +90,8 @@ def home():
 @bp.route("/logout")
 def logout():
     """User logout function."""
+    user_id = session.get("user_id")
+    if user_id is not None:
+        user_cache.invalidate(user_id)
     session.clear()
     return redirect(url_for("home"))
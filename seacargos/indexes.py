@@ -0,0 +1,199 @@
+"""Database index management.
+
+This module declares indexes for application collections and reconciles
+them with database on startup:
+- ensure_indexes(): create missing indexes and rebuild changed ones.
+- check_query_plans(): explain known queries and report COLLSCAN plans.
+Module can be run as a script to reconcile indexes and check query plans,
+it exits with non-zero status if any known query runs collection scan."""
+
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import List
+
+from pymongo import ASCENDING, IndexModel, MongoClient
+from pymongo.database import Database
+
+logger = logging.getLogger("DATABASE")
+
+CACHE_TTL = int(os.getenv("ONE_CACHE_TTL", 86400))
+RUNS_TTL = int(os.getenv("ONE_RUNS_TTL", 30 * 86400))
+
+INDEXES = {
+    "users": [
+        IndexModel([("name", ASCENDING)], name="name_index", unique=True),
+    ],
+    "tracking": [
+        # Dashboard summary, table sorted by departure and user updates
+        IndexModel([("user", ASCENDING), ("trackEnd", ASCENDING),
+                    ("departureDate", ASCENDING), ("_id", ASCENDING)],
+                   name="user_track_end_index"),
+        # Dashboard table sorted by arrival, ETA delay and refId
+        IndexModel([("user", ASCENDING), ("trackEnd", ASCENDING),
+                    ("arrivalDate", ASCENDING), ("_id", ASCENDING)],
+                   name="user_arrival_index"),
+        IndexModel([("user", ASCENDING), ("trackEnd", ASCENDING),
+                    ("etaDelay", ASCENDING), ("_id", ASCENDING)],
+                   name="user_eta_delay_index"),
+        IndexModel([("user", ASCENDING), ("trackEnd", ASCENDING),
+                    ("refId", ASCENDING), ("_id", ASCENDING)],
+                   name="user_ref_id_index"),
+        # Regular update query on estimated schedule events (multikey)
+        IndexModel([("trackEnd", ASCENDING), ("schedule.status", ASCENDING),
+                    ("schedule.eventDate", ASCENDING)],
+                   name="schedule_update_index"),
+        # Smart refresh scheduler query on due records
+        IndexModel([("trackEnd", ASCENDING), ("nextCheck", ASCENDING)],
+                   name="next_check_index"),
+        # Update and trackEnd marking by booking number
+        IndexModel([("bkgNo", ASCENDING), ("trackEnd", ASCENDING)],
+                   name="booking_index"),
+        # Duplicates check by container number
+        IndexModel([("cntrNo", ASCENDING), ("trackEnd", ASCENDING)],
+                   name="container_index"),
+    ],
+    "carrier_cache": [
+        # Remove cached carrier responses after ONE_CACHE_TTL seconds
+        IndexModel([("fetchedAt", ASCENDING)], name="fetched_at_ttl_index",
+                   expireAfterSeconds=CACHE_TTL),
+    ],
+    "etl_runs": [
+        # Recent runs on admin panel, remove runs after ONE_RUNS_TTL seconds
+        IndexModel([("started", ASCENDING)], name="started_ttl_index",
+                   expireAfterSeconds=RUNS_TTL),
+    ],
+    "jobs": [
+        # One pending job per key
+        IndexModel([("key", ASCENDING)], name="pending_key_index",
+                   unique=True,
+                   partialFilterExpression={"status": "pending"}),
+        # Workers take the oldest pending job
+        IndexModel([("status", ASCENDING), ("created", ASCENDING)],
+                   name="status_created_index"),
+        # Dashboard messages of finished user jobs
+        IndexModel([("user", ASCENDING), ("kind", ASCENDING),
+                    ("finished", ASCENDING)],
+                   name="user_kind_finished_index"),
+    ],
+}
+
+# Known query shapes: (name, collection, filter, sort)
+_SAMPLE_DATE = datetime(2000, 1, 1)
+QUERIES = [
+    ("tracking_summary", "tracking", {"user": "user"}, None),
+    ("db_tracking_data", "tracking",
+     {"user": "user", "trackEnd": None}, {"departureDate": -1, "_id": -1}),
+    ("db_tracking_data_arrival", "tracking",
+     {"user": "user", "trackEnd": None}, {"arrivalDate": 1, "_id": 1}),
+    ("db_tracking_data_delay", "tracking",
+     {"user": "user", "trackEnd": None}, {"etaDelay": 1, "_id": 1}),
+    ("db_tracking_data_ref_id", "tracking",
+     {"user": "user", "trackEnd": None}, {"refId": 1, "_id": 1}),
+    ("check_db_records_booking", "tracking",
+     {"bkgNo": "BKG000000000", "line": "ONE", "user": "user",
+      "trackEnd": None}, None),
+    ("check_db_records_container", "tracking",
+     {"cntrNo": "CNTR0000000", "line": "ONE", "user": "user",
+      "trackEnd": None}, None),
+    ("records_to_update", "tracking",
+     {"trackEnd": None,
+      "schedule": {"$elemMatch": {"status": "E",
+                                  "eventDate": {"$lte": _SAMPLE_DATE}}}},
+     None),
+    ("due_chunks", "tracking",
+     {"trackEnd": None, "nextCheck": {"$lte": _SAMPLE_DATE}},
+     {"nextCheck": 1}),
+    ("update", "tracking",
+     {"bkgNo": "BKG000000000", "trackEnd": None, "user": "user",
+      "pending": {"$ne": True}}, None),
+    ("track_end", "tracking",
+     {"bkgNo": "BKG000000000", "trackEnd": None}, None),
+    ("users_by_name", "users", {"name": "user"}, None),
+    ("jobs_claim", "jobs", {"status": "pending"}, {"created": 1}),
+    ("finished_jobs", "jobs",
+     {"user": "user", "kind": "register", "finished": {"$gte": _SAMPLE_DATE}},
+     {"finished": 1}),
+    ("recent_runs", "etl_runs", {}, {"started": -1}),
+]
+
+
+def _same_index(model: IndexModel, info: dict) -> bool:
+    """Compare declared index with database index information."""
+    doc = model.document
+    if list(doc["key"].items()) != [tuple(k) for k in info["key"]]:
+        return False
+    options = {k: v for k, v in doc.items() if k not in ("key", "name")}
+    return all(info.get(k) == v for k, v in options.items())
+
+
+def ensure_indexes(db: Database) -> None:
+    """Create and reconcile declared indexes.
+
+    Missing indexes are created, indexes with the same name and different
+    keys or options are dropped and created again. Indexes which are not
+    declared in INDEXES are left untouched.
+    """
+    for coll, models in INDEXES.items():
+        existing = db[coll].index_information()
+        missing = []
+        for model in models:
+            name = model.document["name"]
+            if name in existing and _same_index(model, existing[name]):
+                continue
+            if name in existing:
+                logger.info(f"Rebuild changed index {coll}.{name}.")
+                db[coll].drop_index(name)
+            missing.append(model)
+        if missing:
+            names = db[coll].create_indexes(missing)
+            logger.info(f"Created indexes on {coll}: {names}.")
+
+
+def _stages(plan: dict) -> List[str]:
+    """Return all stage names of explain plan tree."""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_stages(child))
+    return stages
+
+
+def check_query_plans(db: Database) -> List[str]:
+    """Explain known queries and return names of COLLSCAN queries."""
+    failed = []
+    for name, coll, query, sort in QUERIES:
+        command = {"find": coll, "filter": query}
+        if sort:
+            command["sort"] = sort
+        explain = db.command("explain", command, verbosity="queryPlanner")
+        plan = explain["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in _stages(plan):
+            logger.error(f"Query {name} on {coll} runs collection scan.")
+            failed.append(name)
+    return failed
+
+
+def main() -> int:
+    """Reconcile indexes and check query plans."""
+    logging.basicConfig(level=logging.INFO)
+    URL = os.getenv("FLASK_DB_FRONTEND_URI")
+    DB_NAME = os.getenv("FLASK_DB_NAME")
+    if not URL or not DB_NAME:
+        logger.error(
+            "Environment variables for database connection are not available"
+        )
+        return 1
+    conn = MongoClient(URL)
+    db = conn[DB_NAME]
+    ensure_indexes(db)
+    failed = check_query_plans(db)
+    conn.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
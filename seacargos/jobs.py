@@ -0,0 +1,262 @@
+"""Background jobs for user triggered ETL pipelines.
+
+Web application views put jobs into MongoDB jobs collection with enqueue()
+and return immediately. Worker processes started with main() take pending
+jobs one by one, run ETL pipelines and save job status and progress:
+- pending: job is waiting for a worker.
+- running: job is being processed by a worker.
+- done / failed: job is finished.
+Identical pending jobs of the same user are deduplicated. Finished jobs
+bump user data version (data_versions collection), so web application
+processes drop cached data of the user."""
+
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Iterable, List, Optional
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient, ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+from etl.oneline import etl_many, etl_pending
+from etl.oneline_update import record_schedule_update, user_schedule_update
+
+logger = logging.getLogger("JOBS")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Worker settings
+POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", 1))
+STALE_TIMEOUT = timedelta(minutes=int(os.getenv("JOBS_STALE_TIMEOUT", 60)))
+
+
+def job_key(kind: str, user: str, params: dict) -> str:
+    """Return key which identifies identical jobs."""
+    items = ",".join(f"{k}={params[k]}" for k in sorted(params))
+    if len(items) > 64:
+        items = hashlib.sha1(items.encode()).hexdigest()
+    return f"{kind}:{user}:{items}"
+
+
+def enqueue(db: Database, kind: str, user: str,
+            params: Optional[dict] = None) -> ObjectId:
+    """Add job to queue and return its id.
+
+    If identical job of the same user is already pending, its id is
+    returned instead of adding a new job.
+    """
+    params = params or {}
+    key = job_key(kind, user, params)
+    now = datetime.now().replace(microsecond=0)
+    job = {"kind": kind, "user": user, "params": params, "created": now,
+           "started": None, "finished": None, "error": None,
+           "progress": {"processed": 0, "total": None}}
+    for _ in range(2):
+        try:
+            doc = db.jobs.find_one_and_update(
+                {"key": key, "status": PENDING},
+                {"$setOnInsert": job},
+                upsert=True, projection={"_id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            return doc["_id"]
+        except DuplicateKeyError:
+            # Concurrent enqueue inserted the same pending job
+            continue
+    return db.jobs.find_one({"key": key, "status": PENDING})["_id"]
+
+
+def job_status(db: Database, job_id: str, user: str) -> Optional[dict]:
+    """Return job status for user or None if job not found."""
+    if not ObjectId.is_valid(job_id):
+        return
+    return db.jobs.find_one(
+        {"_id": ObjectId(job_id), "user": user},
+        {"_id": 0, "key": 0}
+    )
+
+
+def data_version(db: Database, user: str) -> int:
+    """Return version of user data changed by jobs."""
+    doc = db.data_versions.find_one({"_id": user})
+    return doc["version"] if doc else 0
+
+
+def bump_data_version(db: Database, user: str) -> None:
+    """Mark user data as changed."""
+    db.data_versions.update_one({"_id": user}, {"$inc": {"version": 1}},
+                                upsert=True)
+
+
+def finished_jobs(db: Database, user: str, kind: str, since: datetime,
+                  seen: Iterable[ObjectId] = ()) -> List[dict]:
+    """Return user jobs of kind finished since given time, oldest first.
+
+    Jobs finished at the same time are told apart by id: jobs with ids in
+    seen are skipped.
+    """
+    return list(db.jobs.find(
+        {"user": user, "kind": kind, "finished": {"$gte": since},
+         "_id": {"$nin": list(seen)}},
+        {"finished": 1, "message": 1, "error": 1}
+    ).sort("finished", 1).limit(20))
+
+
+def claim(db: Database) -> Optional[dict]:
+    """Take the oldest pending job and mark it running."""
+    return db.jobs.find_one_and_update(
+        {"status": PENDING},
+        {"$set": {"status": RUNNING, "worker": os.getpid(),
+                  "started": datetime.now().replace(microsecond=0)}},
+        sort=[("created", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def requeue_stale(db: Database) -> None:
+    """Return jobs of crashed workers back to queue."""
+    started = datetime.now() - STALE_TIMEOUT
+    result = db.jobs.update_many(
+        {"status": RUNNING, "started": {"$lt": started}},
+        {"$set": {"status": PENDING, "started": None}}
+    )
+    if result.modified_count:
+        logger.warning(f"Requeued {result.modified_count} stale jobs.")
+
+
+def progress_callback(db: Database,
+                      job_id: ObjectId) -> Callable[[int], None]:
+    """Return callback which saves job progress."""
+    def progress(processed: int) -> None:
+        db.jobs.update_one({"_id": job_id},
+                           {"$set": {"progress.processed": processed}})
+    return progress
+
+
+def user_update(conn: MongoClient, db: Database, job: dict) -> None:
+    """Update all user records schedules."""
+    total = db.tracking.count_documents(
+        {"user": job["user"], "trackEnd": None, "pending": {"$ne": True}}
+    )
+    db.jobs.update_one({"_id": job["_id"]},
+                       {"$set": {"progress.total": total}})
+    user_schedule_update(conn, db, job["user"],
+                         progress=progress_callback(db, job["_id"]))
+
+
+def record_update(conn: MongoClient, db: Database, job: dict) -> None:
+    """Update one user record schedule."""
+    db.jobs.update_one({"_id": job["_id"]},
+                       {"$set": {"progress.total": 1}})
+    record_schedule_update(conn, db, job["user"],
+                           job["params"]["bkg_number"])
+    progress_callback(db, job["_id"])(1)
+
+
+def register(conn: MongoClient, db: Database, job: dict) -> None:
+    """Complete pending tracking record of a new shipment.
+
+    Job fails if record is kept pending (carrier is unavailable).
+    """
+    db.jobs.update_one({"_id": job["_id"]},
+                       {"$set": {"progress.total": 1}})
+    result = etl_pending(ObjectId(job["params"]["record_id"]), conn, db)
+    db.jobs.update_one({"_id": job["_id"]},
+                       {"$set": {"progress.processed": 1,
+                                 "message": result["etl_message"]}})
+    if result["status"] == "failed":
+        raise RuntimeError(result["etl_message"])
+
+
+def bulk_import(conn: MongoClient, db: Database, job: dict) -> None:
+    """Load a batch of new shipments and save outcome for every item."""
+    items = job["params"]["items"]
+    db.jobs.update_one({"_id": job["_id"]},
+                       {"$set": {"progress.total": len(items)}})
+    outcomes = etl_many(items, conn, db)
+    db.jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"progress.processed": len(items),
+                  "outcomes": job["params"]["skipped"] + outcomes}}
+    )
+
+
+HANDLERS = {
+    "user_update": user_update,
+    "record_update": record_update,
+    "register": register,
+    "import": bulk_import,
+}
+
+
+def run_job(conn: MongoClient, db: Database, job: dict) -> None:
+    """Run job handler and save job result."""
+    result = {"status": DONE, "error": None}
+    try:
+        HANDLERS[job["kind"]](conn, db, job)
+    except BaseException as err:
+        logger.error(f"Job {job['_id']} {job['kind']} failed: {err}")
+        result = {"status": FAILED, "error": str(err)}
+    result["finished"] = datetime.now()
+    bump_data_version(db, job["user"])
+    db.jobs.update_one({"_id": job["_id"]}, {"$set": result})
+
+
+def worker(url: str, db_name: str) -> None:
+    """Take and run jobs until process is terminated."""
+    conn = MongoClient(url)
+    db = conn[db_name]
+    logger.info(f"Worker {os.getpid()} started.")
+    requeue_stale(db)
+    while True:
+        job = claim(db)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        run_job(conn, db, job)
+
+
+def main() -> int:
+    """Start job worker processes."""
+    parser = argparse.ArgumentParser(description="Seacargos job workers.")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("JOBS_WORKERS", 2)))
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=[RotatingFileHandler(
+            'logs/jobs.log', maxBytes=5000000, backupCount=5)],
+        format=('%(asctime)s - %(levelname)s - %(name)s - '
+                '%(filename)s in %(funcName)s:%(lineno)s - %(message)s')
+    )
+    URL = os.getenv("FLASK_DB_FRONTEND_URI")
+    DB_NAME = os.getenv("FLASK_DB_NAME")
+    if not URL or not DB_NAME:
+        logger.error(
+            "Environment variables for database connection are not available"
+        )
+        return 1
+    processes = [
+        multiprocessing.Process(target=worker, args=(URL, DB_NAME))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
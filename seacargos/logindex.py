@@ -0,0 +1,102 @@
+"""Incremental statistics of application log files.
+
+LogIndex remembers byte offset, line count and WARNING / ERROR counts per
+logger for a log file and its RotatingFileHandler backups (.1, .2 ...).
+Files are identified by inode, so renamed backups are not scanned again,
+and only bytes appended since the previous refresh are read."""
+
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List
+
+# Block size for log file scanning
+BLOCK_SIZE = 1 << 16
+
+# Level and logger name of log line formatted as
+# '%(asctime)s - %(levelname)s - %(name)s - ...'
+LEVEL_PATTERN = re.compile(
+    rb"^\S+ \S+ - (WARNING|ERROR|CRITICAL) - (.+?) - ", re.MULTILINE
+)
+
+
+class FileState:
+    """Scanned part of a single log file."""
+    __slots__ = ("offset", "lines", "levels")
+
+    def __init__(self) -> None:
+        self.offset = 0
+        self.lines = 0
+        self.levels = Counter()
+
+
+class LogIndex:
+    """Thread safe incremental index of log file with rotated backups."""
+
+    def __init__(self, path: str, backups: int = 5) -> None:
+        self.path = path
+        self.backups = backups
+        self._files: Dict[int, FileState] = {}
+        self._lock = threading.Lock()
+
+    def paths(self) -> List[str]:
+        """Return paths of log file and its backups."""
+        return [self.path] + [f"{self.path}.{i}"
+                              for i in range(1, self.backups + 1)]
+
+    def _scan(self, path: str, state: FileState) -> None:
+        """Read complete lines appended after state offset."""
+        with open(path, "rb") as f:
+            f.seek(state.offset)
+            tail = b""
+            while True:
+                block = f.read(BLOCK_SIZE)
+                if not block:
+                    break
+                data = tail + block
+                end = data.rfind(b"\n") + 1
+                tail = data[end:]
+                if not end:
+                    continue
+                complete = data[:end]
+                state.lines += complete.count(b"\n")
+                for match in LEVEL_PATTERN.finditer(complete):
+                    level = match.group(1).decode()
+                    if level == "CRITICAL":
+                        level = "ERROR"
+                    state.levels[(match.group(2).decode(), level)] += 1
+                state.offset += end
+
+    def refresh(self) -> dict:
+        """Scan new log lines and return log statistics.
+
+        Returns total size, number of files and lines and WARNING / ERROR
+        counts per logger name.
+        """
+        with self._lock:
+            files = {}
+            size = 0
+            for path in self.paths():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                state = self._files.get(stat.st_ino)
+                if state is None or stat.st_size < state.offset:
+                    state = FileState()
+                if stat.st_size > state.offset:
+                    self._scan(path, state)
+                files[stat.st_ino] = state
+                size += stat.st_size
+            self._files = files
+            levels = Counter()
+            for state in files.values():
+                levels.update(state.levels)
+            loggers = {}
+            for (name, level), count in sorted(levels.items()):
+                loggers.setdefault(name, {"WARNING": 0, "ERROR": 0})
+                loggers[name][level] = count
+            return {"files": len(files), "size": size,
+                    "lines": sum(state.lines for state in files.values()),
+                    "loggers": loggers}
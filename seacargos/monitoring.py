@@ -0,0 +1,164 @@
+"""Application monitoring.
+
+- /metrics exposes ETL run metrics of all processes in Prometheus text
+format for scraping.
+- CommandProfiler is a pymongo command listener which counts database
+commands and their time per web request. init_app() adds the numbers to
+Server-Timing response header and writes slow requests and commands with
+their filter shape to logs/slow.log."""
+
+import logging
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any, Optional
+
+from flask import Blueprint, Flask, Response, g, request
+from pymongo import monitoring
+
+from db import db_conn
+from etl.metrics import render
+
+bp = Blueprint("monitoring", __name__)
+slow_logger = logging.getLogger("SLOW QUERY")
+
+# Slow request and command threshold, milliseconds
+SLOW_QUERY_MS = 100
+
+# Command fields with query filter
+FILTER_FIELDS = ("filter", "query", "q")
+
+
+@bp.route("/metrics")
+def metrics():
+    """ETL metrics in Prometheus text format."""
+    db = db_conn()[g.db_name]
+    return Response(render(db), mimetype="text/plain; version=0.0.4")
+
+
+def shape(value: Any) -> Any:
+    """Return query shape: keys and operators without values."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return [shape(item) for item in value]
+    return "?"
+
+
+def command_shape(name: str, command: dict) -> Optional[Any]:
+    """Return filter shape of database command."""
+    for field in FILTER_FIELDS:
+        if isinstance(command.get(field), dict):
+            return shape(command[field])
+    if name == "aggregate":
+        return [shape(stage) for stage in command.get("pipeline", [])
+                if "$match" in stage]
+    for field in ("updates", "deletes"):
+        if command.get(field):
+            return shape(command[field][0].get("q", {}))
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """Count database commands and their time per thread.
+
+    Profiling of a thread is started with start() and its results are
+    returned by stop(). Commands slower than threshold are logged with
+    their filter shape in any thread.
+    """
+
+    def __init__(self, threshold: float = SLOW_QUERY_MS) -> None:
+        self.threshold = threshold
+        self._local = threading.local()
+        self._commands = {}
+
+    def start(self) -> None:
+        """Start profiling of current thread."""
+        self._local.profile = {"count": 0, "time": 0.0, "slowest": None}
+
+    def stop(self) -> Optional[dict]:
+        """Stop profiling of current thread and return its profile."""
+        profile = getattr(self._local, "profile", None)
+        self._local.profile = None
+        return profile
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        self._commands[event.request_id] = (
+            collection if isinstance(collection, str) else None,
+            command_shape(event.command_name, event.command),
+        )
+
+    def _finished(self, event) -> None:
+        collection, filter_shape = self._commands.pop(event.request_id,
+                                                      (None, None))
+        duration = event.duration_micros / 1000
+        command = {"name": event.command_name, "collection": collection,
+                   "duration": duration, "shape": filter_shape}
+        profile = getattr(self._local, "profile", None)
+        if profile is not None:
+            profile["count"] += 1
+            profile["time"] += duration
+            slowest = profile["slowest"]
+            if slowest is None or duration > slowest["duration"]:
+                profile["slowest"] = command
+        if duration >= self.threshold:
+            slow_logger.warning(
+                (f"Slow command {event.command_name} on {collection}: "
+                 f"{duration:.1f} ms, filter {filter_shape}.")
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+
+def init_app(app: Flask) -> CommandProfiler:
+    """Register database profiler and Server-Timing header.
+
+    Profiler is registered for database clients created after this call.
+    Disabled with DB_PROFILING=false, threshold is set with SLOW_QUERY_MS.
+    """
+    profiler = CommandProfiler(app.config.get("SLOW_QUERY_MS", SLOW_QUERY_MS))
+    if not app.config.get("DB_PROFILING", True):
+        return profiler
+    monitoring.register(profiler)
+    if not slow_logger.handlers:
+        handler = RotatingFileHandler('logs/slow.log', maxBytes=5000000,
+                                      backupCount=5)
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+        ))
+        slow_logger.addHandler(handler)
+        slow_logger.propagate = False
+
+    @app.before_request
+    def start_profile():
+        g.request_start = time.perf_counter()
+        profiler.start()
+
+    @app.after_request
+    def add_server_timing(response):
+        profile = profiler.stop()
+        if profile is None:
+            return response
+        total = (time.perf_counter() - g.request_start) * 1000
+        response.headers.add(
+            "Server-Timing",
+            (f'db;dur={profile["time"]:.1f};desc="{profile["count"]} '
+             f'commands", app;dur={total:.1f}')
+        )
+        if total >= profiler.threshold:
+            slowest = profile["slowest"] or {}
+            slow_logger.warning(
+                (f"Slow request {request.method} {request.path}: "
+                 f"{total:.1f} ms, {profile['count']} commands "
+                 f"{profile['time']:.1f} ms, slowest "
+                 f"{slowest.get('name')} on {slowest.get('collection')} "
+                 f"{slowest.get('duration', 0):.1f} ms, "
+                 f"filter {slowest.get('shape')}.")
+            )
+        return response
+
+    return profiler
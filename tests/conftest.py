@@ -0,0 +1,23 @@
+"""Test fixtures.
+
+Application modules are imported the same way the web application does,
+so seacargos directory is added to python path here."""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "seacargos"))
+
+from benchmarks import stub  # noqa: E402
+
+
+@pytest.fixture
+def one_stub():
+    """Local ONE stub server without latency."""
+    server = stub.start(0)
+    yield server
+    server.shutdown()
@@ -0,0 +1,132 @@
+import socket
+import time
+
+import pytest
+import requests
+
+from etl.client import (
+    CarrierClient,
+    CircuitBreaker,
+    CircuitOpenError,
+    TokenBucket,
+)
+
+
+def counting_client(url, **kwargs):
+    """Return client without backoff which counts limiter tokens."""
+    client = CarrierClient(url, backoff=0, rate=0, **kwargs)
+    client.tokens = 0
+    acquire = client.limiter.acquire
+
+    def counting_acquire():
+        client.tokens += 1
+        acquire()
+
+    client.limiter.acquire = counting_acquire
+    return client
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, burst=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # Burst of 2 tokens, 4 more are refilled at 10 ms each
+    assert time.monotonic() - start >= 0.035
+
+
+def test_token_bucket_disabled():
+    bucket = TokenBucket(rate=0, burst=1)
+    start = time.monotonic()
+    for _ in range(1000):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.1
+
+
+def test_circuit_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == breaker.CLOSED
+    breaker.failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+    assert breaker.remaining() > 0
+
+    # Single probe request after reset timeout, failure opens again
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == breaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+
+    # Successful probe closes circuit
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == breaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == breaker.CLOSED
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_take_token_per_attempt(one_stub, status):
+    one_stub.fail_rate = 1.0
+    one_stub.fail_status = status
+    client = counting_client(one_stub.url, retries=2)
+    r = client.get({"f_cmd": "125"})
+    assert r.status_code == status
+    assert one_stub.requests == 3
+    assert client.tokens == 3
+    # Retried request counts as a single breaker failure
+    assert client.breaker.failures == 1
+
+
+def test_retry_recovers(one_stub):
+    one_stub.fail_first = 1
+    client = counting_client(one_stub.url, retries=1)
+    status, data = client.fetch_json({"f_cmd": "125", "cop_no": "C1"})
+    assert status == 200
+    assert data["list"]
+    assert one_stub.requests == 2
+    assert client.breaker.state == client.breaker.CLOSED
+
+
+def test_connection_errors_are_retried():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    client = counting_client(f"http://127.0.0.1:{port}/", retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.get({})
+    assert client.tokens == 3
+    assert client.breaker.failures == 1
+
+
+def test_open_circuit_rejects_requests(one_stub):
+    one_stub.fail_rate = 1.0
+    client = counting_client(one_stub.url, retries=0, breaker_failures=1)
+    assert client.get({}).status_code == 503
+    with pytest.raises(CircuitOpenError):
+        client.get({})
+    assert one_stub.requests == 1
+
+
+def test_retry_after_header():
+    client = CarrierClient("http://localhost/", backoff=0.5)
+    r = requests.Response()
+    r.status_code = 429
+    r.headers["Retry-After"] = "2"
+    assert client.delay(1, r) == 2
+    assert client.delay(1) == 0.5
+    assert client.delay(3) == 2
@@ -0,0 +1,47 @@
+import threading
+
+from etl import oneline_update
+from etl.client import CarrierClient
+from etl.metrics import Run, bind_run, observe_request
+
+
+def test_latencies_go_to_run_of_calling_thread():
+    entered = threading.Event()
+    done = threading.Event()
+    other = Run("other", None)
+
+    def other_pipeline():
+        with other:
+            entered.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=other_pipeline)
+    thread.start()
+    entered.wait(5)
+    with Run("regular", None) as run:
+        observe_request(0.1)
+        observe_request(0.2)
+    done.set()
+    thread.join()
+    observe_request(0.3)
+    assert run.latencies == [0.1, 0.2]
+    assert other.latencies == []
+
+
+def test_bound_function_reports_to_run():
+    with Run("regular", None) as run:
+        bound = bind_run(observe_request)
+    thread = threading.Thread(target=bound, args=(0.5,))
+    thread.start()
+    thread.join()
+    assert run.latencies == [0.5]
+
+
+def test_fetch_workers_report_to_run(one_stub, monkeypatch):
+    client = CarrierClient(one_stub.url, retries=0, rate=0)
+    monkeypatch.setattr(oneline_update, "get_client", lambda: client)
+    recs = [{"bkgNo": f"SHAB{i:08d}", "copNo": f"CSHA{i:08d}"}
+            for i in range(8)]
+    with Run("regular", None) as run:
+        oneline_update.fetch_schedules(recs, workers=4)
+    assert len(run.latencies) == 8
@@ -0,0 +1,45 @@
+import pytest
+
+from etl import oneline_update
+from etl.client import CarrierClient
+
+
+@pytest.fixture
+def client(one_stub, monkeypatch):
+    """Carrier client of ONE stub without client retries and delays."""
+    client = CarrierClient(one_stub.url, retries=0, rate=0,
+                           breaker_failures=100)
+    monkeypatch.setattr(oneline_update, "get_client", lambda: client)
+    monkeypatch.setattr(oneline_update, "RETRY_DELAY", 0)
+    return client
+
+
+def records(n):
+    return [{"bkgNo": f"SHAB{i:08d}", "copNo": f"CSHA{i:08d}"}
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_failed_records_are_requeued(one_stub, client, workers):
+    one_stub.fail_first = 3
+    one_stub.fail_status = 429
+    recs = records(3)
+    oneline_update.extract_schedule_details(recs, workers, retry_rounds=1)
+    assert all(rec["schedule"] for rec in recs)
+    assert all("retry" not in rec for rec in recs)
+    assert one_stub.requests == 6
+
+
+def test_retry_rounds_are_limited(one_stub, client):
+    one_stub.fail_rate = 1.0
+    recs = records(3)
+    oneline_update.extract_schedule_details(recs, 1, retry_rounds=2)
+    assert all(rec["schedule"] is None for rec in recs)
+    assert all("retry" not in rec for rec in recs)
+    assert one_stub.requests == 9
+
+
+@pytest.mark.parametrize("bkg_number", [None, "SHAB00000001"])
+def test_user_updates_skip_pending_records(bkg_number):
+    query, _ = oneline_update.records_query("user", bkg_number)
+    assert query["pending"] == {"$ne": True}
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from etl.schedule import (
+    CHECK_AFTER,
+    CHECK_BEFORE,
+    CHECK_MAX,
+    CHECK_OVERDUE,
+    next_check,
+)
+
+NOW = datetime(2023, 1, 15, 12)
+
+
+def event(status, date):
+    return {"status": status, "eventDate": date}
+
+
+def test_no_estimated_events():
+    schedule = [event("A", NOW - timedelta(days=1)), event("E", None)]
+    assert next_check(schedule, NOW) == NOW + CHECK_MAX
+
+
+def test_before_and_after_upcoming_event():
+    arrival = NOW + timedelta(days=1)
+    assert (next_check([event("E", arrival)], NOW)
+            == arrival - CHECK_BEFORE)
+    arrival = NOW + timedelta(hours=3)
+    assert next_check([event("E", arrival)], NOW) == arrival + CHECK_AFTER
+
+
+def test_long_leg_is_checked_every_check_max():
+    arrival = NOW + timedelta(days=20)
+    assert next_check([event("E", arrival)], NOW) == NOW + CHECK_MAX
+
+
+def test_overdue_backoff():
+    recent = NOW - timedelta(minutes=10)
+    assert next_check([event("E", recent)], NOW) == NOW + CHECK_OVERDUE
+    old = NOW - timedelta(days=30)
+    assert next_check([event("E", old)], NOW) == NOW + CHECK_MAX
+
+
+def test_stale_estimated_event_does_not_hide_upcoming_one():
+    arrival = NOW + timedelta(hours=3)
+    schedule = [
+        event("E", NOW - timedelta(days=30)),
+        event("A", NOW - timedelta(days=10)),
+        event("E", arrival),
+    ]
+    assert next_check(schedule, NOW) == arrival + CHECK_AFTER